@@ -5,9 +5,6 @@ import os
 from flow_pipeline import SalesPipeline
 import pandas as pd
 
-# Set OpenAI Model
-os.environ['OPENAI_MODEL_NAME'] = 'gpt-4o-mini'
-
 # Initialize the SalesPipeline
 flow = SalesPipeline()
 
@@ -24,24 +21,19 @@ if "state" not in st.session_state:
 # Function to run the pipeline
 def kickoff_pipeline():
     with st.spinner("Running the pipeline..."):
-        # Execute the SalesPipeline (Crew execution)
-        crew_output = flow.kickoff()
-
-        # Handle both single CrewOutput and list of CrewOutput objects
-        if isinstance(crew_output, list):  # Multiple outputs (e.g., kickoff_for_each)
-            all_task_outputs = []
-            for single_output in crew_output:
-                all_task_outputs.extend(single_output.tasks_output)
-        else:  # Single output (kickoff())
-            all_task_outputs = crew_output.tasks_output
+        # Execute the SalesPipeline; it returns the LeadRecords that got an email
+        records = flow.kickoff()
 
-        # Store structured results in Streamlit state
-        st.session_state.state["score_crews_results"] = [
-            output.pydantic.to_dict() if output.pydantic else output.raw for output in all_task_outputs
-        ]
+        # Store structured results in Streamlit state, in LeadScoringResult.to_dict() form
+        scored = flow.state.get("score_crews_results", [])
+        st.session_state.state["score_crews_results"] = [record.email_inputs() for record in scored]
+        st.session_state.state["task_outputs"] = [record.load_score_transcript() for record in scored]
         st.session_state.state["stored_scores"] = flow.state.get("stored_scores", [])
-        st.session_state.state["filtered_leads"] = flow.state.get("filtered_leads", [])
-        st.session_state.state["emails"] = flow.state.get("emails", [])
+        st.session_state.state["filtered_leads"] = [record.email_inputs() for record in flow.state.get("filtered_leads", [])]
+        st.session_state.state["emails"] = [
+            {"Lead Name": record.name, "Company Name": record.company_name, "Email": record.email}
+            for record in records or []
+        ]
 
         st.success("Pipeline completed! Results are now available.")
 
@@ -114,8 +106,8 @@ with tab3:
 # Tab 4: Task Outputs
 with tab4:
     st.write("Task Outputs:")
-    if st.session_state.state["score_crews_results"]:
-        task_outputs = st.session_state.state["score_crews_results"]
+    if st.session_state.state["task_outputs"]:
+        task_outputs = st.session_state.state["task_outputs"]
         st.json(task_outputs)  # For detailed JSON viewing
     else:
         st.warning("No task outputs available yet. Run the pipeline.")
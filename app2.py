@@ -8,9 +8,6 @@ from crewai.tasks.task_output import TaskOutput
 from typing import Any, Dict
 from crewai.agents.agent_builder.base_agent import BaseAgent
 
-# Set OpenAI Model
-os.environ['OPENAI_MODEL_NAME'] = 'gpt-4o-mini'
-
 # Initialize the SalesPipeline
 flow = SalesPipeline()
 
@@ -43,38 +40,37 @@ if st.button("Run Pipeline"):
         # Add a log message indicating pipeline start
         manager_handler.log_message("Pipeline Manager", "Starting the SalesPipeline...")
 
-        # Execute the SalesPipeline
-        crew_output = flow.kickoff()
+        # Execute the SalesPipeline; it returns the LeadRecords that got an email
+        records = flow.kickoff() or []
 
-        # Check if the output is a single CrewOutput or a list
-        if isinstance(crew_output, list):
-            all_task_outputs = [task for output in crew_output for task in output.tasks_output]
-        else:
-            all_task_outputs = crew_output.tasks_output
+        # Task outputs live in the transcripts the records point to
+        transcripts = [record.load_score_transcript() for record in flow.state.get("score_crews_results", [])]
+        transcripts += [record.load_email_transcript() for record in records]
+        all_task_outputs = [task for transcript in transcripts if transcript for task in transcript.get("tasks_output", [])]
 
         # Process outputs dynamically as they are available
         for task_output in all_task_outputs:
             # Log agent interactions in the Task Outputs tab
-            manager_handler.log_message("Pipeline Manager", f"Processing task: {task_output.description}")
+            manager_handler.log_message("Pipeline Manager", f"Processing task: {task_output['description']}")
 
             # Display agent conversations in the Task Outputs tab
-            st.chat_message(task_output.agent).write(task_output.raw or "No conversation available.")
+            st.chat_message(task_output["agent"]).write(task_output["raw"] or "No conversation available.")
 
             # Check the type of task and log results to specific tabs
-            if "lead scoring" in task_output.description.lower():
+            if "lead scoring" in task_output["description"].lower():
                 scoring_agent_handler.log_message(
                     "Scoring Agent", 
-                    f"Lead Scoring Task Completed: {task_output.raw}"
+                    f"Lead Scoring Task Completed: {task_output['raw']}"
                 )
-            elif "lead filtering" in task_output.description.lower():
+            elif "lead filtering" in task_output["description"].lower():
                 filtering_agent_handler.log_message(
                     "Filtering Agent", 
-                    f"Lead Filtering Task Completed: {task_output.raw}"
+                    f"Lead Filtering Task Completed: {task_output['raw']}"
                 )
-            elif "email generation" in task_output.description.lower():
+            elif "email generation" in task_output["description"].lower():
                 email_agent_handler.log_message(
                     "Email Generator", 
-                    f"Email Generation Task Completed: {task_output.raw}"
+                    f"Email Generation Task Completed: {task_output['raw']}"
                 )
 
         # Indicate pipeline completion
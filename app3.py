@@ -8,9 +8,6 @@ import textwrap
 import re
 import sys
 
-# Set OpenAI Model
-os.environ['OPENAI_MODEL_NAME'] = 'gpt-4o-mini'
-
 # Initialize the SalesPipeline
 flow = SalesPipeline()
 
@@ -66,43 +63,27 @@ def add_to_chat(role, content):
 # Function to parse pipeline outputs
 def process_pipeline_outputs(emails):
     """Parse the outputs of tasks from the pipeline and update session state."""
+    # Scores are LeadRecords; their full crew transcripts are read back from disk
     scores = flow.state["score_crews_results"]
     if scores:
-        lead_scoring_result = scores[0].pydantic
-
         # Prepare data for Lead Scores tab
-        lead_data = {
-            'Name': lead_scoring_result.personal_info.name,
-            'Job Title': lead_scoring_result.personal_info.job_title,
-            'Role Relevance': lead_scoring_result.personal_info.role_relevance,
-            'Professional Background': lead_scoring_result.personal_info.professional_background,
-            'Company Name': lead_scoring_result.company_info.company_name,
-            'Industry': lead_scoring_result.company_info.industry,
-            'Company Size': lead_scoring_result.company_info.company_size,
-            'Revenue': lead_scoring_result.company_info.revenue,
-            'Market Presence': lead_scoring_result.company_info.market_presence,
-            'Lead Score': lead_scoring_result.lead_score.score,
-            'Scoring Criteria': ', '.join(lead_scoring_result.lead_score.scoring_criteria),
-            'Validation Notes': lead_scoring_result.lead_score.validation_notes
-        }
-        st.session_state.state["score_crews_results"] = lead_data
+        st.session_state.state["score_crews_results"] = scores[0].score_table()
 
         # Process filtered leads
-        filtered_leads_data = {
-            'Name': lead_scoring_result.personal_info.name,
-            'Job Title': lead_scoring_result.personal_info.job_title,
-            'Role Relevance': lead_scoring_result.personal_info.role_relevance,
-            'Professional Background': lead_scoring_result.personal_info.professional_background,
-            'Company Name': lead_scoring_result.company_info.company_name,
-            'Industry': lead_scoring_result.company_info.industry,
-            'Validation Notes': lead_scoring_result.lead_score.validation_notes
-        }
-        st.session_state.state["filtered_leads"].append(filtered_leads_data)
+        for record in flow.state.get("filtered_leads", []):
+            st.session_state.state["filtered_leads"].append(record.filtered_table())
+
+        for record in scores:
+            transcript = record.load_score_transcript() or {}
+            for task in transcript.get("tasks_output", []):
+                st.session_state.state["task_outputs"].append(
+                    {"agent": task["agent"], "description": task["description"], "conversation": task["raw"]}
+                )
 
     # Process emails
     if emails:
-        for email in emails:
-            wrapped_email = textwrap.fill(email.raw, width=80)
+        for record in emails:
+            wrapped_email = textwrap.fill(record.email, width=80)
             st.session_state.state["emails"].append(wrapped_email)
 
 
@@ -172,8 +153,9 @@ with tab3:
 with tab4:
     st.write("Cost Analysis:")
     if flow.state.get("score_crews_results"):
-        usage_metrics_df = pd.DataFrame([flow.state["score_crews_results"][0].token_usage.dict()])
-        cost = 0.150 * usage_metrics_df["total_tokens"].sum() / 1_000_000
+        usage_metrics_df = pd.DataFrame([record.score_usage_dict() for record in flow.state["score_crews_results"]])
+        # Priced per model by the run's budget governor
+        cost = flow.state.get("budget", {}).get("dollars", 0.0)
         st.metric(label="Total Costs ($)", value=f"{cost:.4f}")
         st.table(usage_metrics_df)
     else:
@@ -182,8 +164,8 @@ with tab4:
 # Tab 5: Task Outputs
 with tab5:
     st.write("Task Outputs (Agent Conversations):")
-    if st.session_state["task_outputs"]:
-        for output in st.session_state["task_outputs"]:
+    if st.session_state.state["task_outputs"]:
+        for output in st.session_state.state["task_outputs"]:
             with st.expander(f"Agent: {output['agent']}", expanded=False):
                 st.write(f"**Task Description:** {output['description']}")
                 st.text_area("Conversation", output["conversation"], height=200)
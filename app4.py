@@ -7,11 +7,12 @@ import pandas as pd
 import textwrap
 from IPython.display import HTML
 from flow_pipeline import StreamToExpander
+from email_stream import DraftStream, attach
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 import sys
 import textwrap
-
-# Set OpenAI Model
-os.environ['OPENAI_MODEL_NAME'] = 'gpt-4o-mini'
+import threading
+import time
 
 # Initialize the SalesPipeline
 flow = SalesPipeline()
@@ -20,11 +21,14 @@ flow = SalesPipeline()
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
 
+# Only compact LeadRecords are kept per session; tables and wrapped text are built when rendered
 if "state" not in st.session_state:
     st.session_state.state = {
         "score_crews_results": [],
         "filtered_leads": [],
-        "emails": []
+        "emails": [],
+        "budget": {},
+        "model_routing": {}
     }
 
 
@@ -37,56 +41,68 @@ def add_to_chat(role, content):
 
 # Function to parse pipeline outputs
 def process_pipeline_outputs(emails):
-    """Parse the outputs of tasks from the pipeline and update session state."""
-    # Process lead scores
-    scores = flow.state["score_crews_results"]
-    if scores:
-        for i in range(len(scores)):
-            lead_scoring_result = scores[i].pydantic
-
-            # Prepare data for Lead Scores tab
-            lead_data = {
-                'Name': lead_scoring_result.personal_info.name,
-                'Job Title': lead_scoring_result.personal_info.job_title,
-                'Role Relevance': lead_scoring_result.personal_info.role_relevance,
-                'Professional Background': lead_scoring_result.personal_info.professional_background,
-                'Company Name': lead_scoring_result.company_info.company_name,
-                'Industry': lead_scoring_result.company_info.industry,
-                'Company Size': lead_scoring_result.company_info.company_size,
-                'Revenue': lead_scoring_result.company_info.revenue,
-                'Market Presence': lead_scoring_result.company_info.market_presence,
-                'Lead Score': lead_scoring_result.lead_score.score,
-                'Scoring Criteria': ', '.join(lead_scoring_result.lead_score.scoring_criteria),
-                'Validation Notes': lead_scoring_result.lead_score.validation_notes
-            }
-            st.session_state.state["score_crews_results"].append(lead_data)
-
-            # Process filtered leads
-            filtered_leads_data = {
-                'Name': lead_scoring_result.personal_info.name,
-                'Job Title': lead_scoring_result.personal_info.job_title,
-                'Role Relevance': lead_scoring_result.personal_info.role_relevance,
-                'Professional Background': lead_scoring_result.personal_info.professional_background,
-                'Company Name': lead_scoring_result.company_info.company_name,
-                'Industry': lead_scoring_result.company_info.industry,
-                'Validation Notes': lead_scoring_result.lead_score.validation_notes
-            }
-            st.session_state.state["filtered_leads"].append(filtered_leads_data)
-
-    # Process emails
-    #emails = flow.state["emails"]
-    if emails:
-        for email in emails:
-            wrapped_email = textwrap.fill(email.raw, width=80)
-            st.session_state.state["emails"].append(wrapped_email)
+    """Keep the LeadRecords of the run in session state."""
+    st.session_state.state["score_crews_results"] = list(flow.state["score_crews_results"])
+    st.session_state.state["filtered_leads"] = list(flow.state.get("filtered_leads", []))
+    st.session_state.state["emails"] = list(emails or [])
+    # Run totals, priced per model (agent models, escalations and the budget's cheap model)
+    st.session_state.state["budget"] = dict(flow.state.get("budget", {}))
+    st.session_state.state["model_routing"] = dict(flow.state.get("model_routing", {}))
+
+
+# Render streamed email drafts while the flow runs in a worker thread
+def stream_email_drafts(worker, draft_stream):
+    st.subheader("Live Email Drafts", anchor=False)
+    panels = {}
+    rendered_version = -1
+    while True:
+        finished = not worker.is_alive()
+        # Repaint only when new tokens arrived; everything since the last repaint is coalesced
+        if draft_stream.version != rendered_version:
+            rendered_version = draft_stream.version
+            for key, draft in draft_stream.snapshot().items():
+                if key not in panels:
+                    panels[key] = st.expander(draft["label"], expanded=True).empty()
+                panels[key].markdown(draft["text"] + ("" if draft["done"] else " ▌"))
+        if finished:
+            break
+        time.sleep(0.1)
 
 
 # Main pipeline execution
 def kickoff_pipeline():
     with st.spinner("Running the pipeline..."):
         add_to_chat("assistant", "Starting the pipeline...")
-        emails = flow.kickoff()
+        # Without crewai streaming events each panel still fills once its email is finished
+        attach()
+        draft_stream = DraftStream()
+        flow.draft_stream = draft_stream
+        result = {}
+
+        def run_flow():
+            try:
+                result["emails"] = flow.kickoff()
+            except Exception as exc:
+                result["error"] = exc
+
+        worker = threading.Thread(target=run_flow)
+        add_script_run_ctx(worker)
+        worker.start()
+        stream_email_drafts(worker, draft_stream)
+        worker.join()
+        if "error" in result:
+            raise result["error"]
+        emails = result["emails"]
         process_pipeline_outputs(emails)
+        shared_work = flow.state.get("shared_work")
+        if shared_work:
+            add_to_chat("assistant", f"Reused {len(shared_work)} crew runs already in flight for another session ({', '.join(sorted({work['kind'] for work in shared_work}))}).")
+        duplicate_groups = flow.state.get("duplicate_groups")
+        if duplicate_groups:
+            add_to_chat("assistant", f"Merged {len(duplicate_groups)} groups of duplicate leads (rows {duplicate_groups}).")
+        early_exit = flow.state.get("early_exit")
+        if early_exit:
+            add_to_chat("assistant", f"Early exit skipped {early_exit['skipped']} of {early_exit['total']} leads ({early_exit['skip_rate']:.0%}).")
         add_to_chat("assistant", "Pipeline execution complete!")
     return emails 
 
@@ -126,11 +142,20 @@ tab1, tab2, tab3, tab4= st.tabs(
 with tab1:
     st.write("Lead Scores:")
     if st.session_state.state["score_crews_results"]:
-        for i in range(len(st.session_state.state["score_crews_results"])):
+        for record in st.session_state.state["score_crews_results"]:
             lead_scores_df = pd.DataFrame.from_dict(
-                st.session_state.state["score_crews_results"][i], orient="index", columns=["Value"]
+                record.score_table(), orient="index", columns=["Value"]
             ).reset_index().rename(columns={"index": "Attribute"})
             st.table(lead_scores_df)
+            if "scoring" in record.shared:
+                st.caption("🔗 Scored by a run already in flight in another session")
+            # Transcripts live on disk and are only read when asked for
+            if record.score_transcript and st.checkbox(f"Show scoring transcript - {record.name}", key=f"transcript-{record.index}"):
+                transcript = record.load_score_transcript()
+                if transcript is None:
+                    st.caption("Transcript removed by retention (records.keep_runs)")
+                else:
+                    st.json(transcript)
     else:
         st.warning("No scores available yet. Run the pipeline.")
 
@@ -138,7 +163,7 @@ with tab1:
 with tab2:
     st.write("Filtered Leads:")
     if st.session_state.state["filtered_leads"]:
-        filtered_leads_df = pd.DataFrame(st.session_state.state["filtered_leads"])
+        filtered_leads_df = pd.DataFrame([record.filtered_table() for record in st.session_state.state["filtered_leads"]])
         st.table(filtered_leads_df)
     else:
         st.warning("No filtered leads available yet. Run the pipeline.")
@@ -147,29 +172,31 @@ with tab2:
 with tab3:
     st.write("Generated Emails:")
     if st.session_state.state["emails"]:
-        for index, email in enumerate(st.session_state.state["emails"]):
-            scores = flow.state["score_crews_results"]
-            lead_scoring_result = scores[index].pydantic
-            st.text_area(f"Generated Email - {lead_scoring_result.company_info.company_name}", email, height=150)
+        for record in st.session_state.state["emails"]:
+            wrapped_email = textwrap.fill(record.email, width=80)
+            st.text_area(f"Generated Email - {record.company_name}", wrapped_email, height=150)
+            if "email" in record.shared:
+                st.caption("🔗 Written by a run already in flight in another session")
     else:
         st.warning("No emails generated yet. Run the pipeline.")
 
 # Tab 4: Costs
 with tab4:
     st.write("Cost Analysis:")
-    if flow.state.get("score_crews_results"):
-        for index, email in enumerate(st.session_state.state["emails"]):
-            lead_scoring_result = scores[index].pydantic
-            # Convert UsageMetrics instance to a DataFrame
-            df_usage_scoreLead_metrics = pd.DataFrame([flow.state["score_crews_results"][index].token_usage.dict()])
-            # Convert UsageMetrics instance to a DataFrame
-            df_usage_email_metrics = pd.DataFrame([result[index].token_usage.dict()])
-            # Calculate total costs
-            costs_score = 0.150 * df_usage_scoreLead_metrics['total_tokens'].sum() / 1_000_000
-            costs_email = 0.150 * df_usage_email_metrics['total_tokens'].sum() / 1_000_000
-            st.metric(label=f"Total Score Lead Costs - {lead_scoring_result.personal_info.name} - {lead_scoring_result.company_info.company_name} ($)", value=f"{costs_score:.4f}")
-            st.table(df_usage_scoreLead_metrics)
-            st.metric(label=f"Total Email Costs {lead_scoring_result.personal_info.name} - {lead_scoring_result.company_info.company_name} ($)", value=f"{costs_email:.4f}")
-            st.table(df_usage_email_metrics)
+    if st.session_state.state["emails"]:
+        budget = st.session_state.state["budget"]
+        routing = st.session_state.state["model_routing"]
+        # Dollars come from the budget governor, which prices each agent at its own model
+        st.metric(label="Total Run Costs ($)", value=f"{budget.get('dollars', 0.0):.4f}")
+        st.metric(label="Total Run Tokens", value=budget.get("tokens", 0))
+        if routing:
+            st.metric(label="Cascade Savings vs Strong Model ($)", value=f"{routing.get('cost_saved', 0.0):.4f}")
+            st.table(pd.DataFrame([routing]))
+        if budget.get("triggered"):
+            st.caption(f"Budget steps triggered: {', '.join(budget['triggered'])}; skipped: {budget.get('skipped', {})}")
+        for record in st.session_state.state["emails"]:
+            # Per-lead token usage; models differ per agent, so dollars are only shown for the run
+            st.write(f"Token usage - {record.name} - {record.company_name}")
+            st.table(pd.DataFrame([record.score_usage_dict(), record.email_usage_dict()], index=["Score Lead", "Email"]))
     else:
         st.warning("No usage metrics available yet. Run the pipeline.")
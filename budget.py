@@ -0,0 +1,88 @@
+import re
+import time
+from typing import Dict, List, Optional
+
+from dedup import normalize_text
+
+ACTIONS = ('skip_optimization', 'cheap_model', 'stop')
+
+
+def lead_prior(lead: Dict, config: Dict) -> float:
+    """Cheap estimate of a lead's value from its form fields, used to schedule
+    high-value leads first. No LLM calls."""
+    lead_data = lead["lead_data"]
+    prior = 0.0
+    title = normalize_text(lead_data.get("job_title"))
+    for pattern, weight in config.get('title_weights', {}).items():
+        if re.search(pattern, title):
+            prior = max(prior, weight)
+    # normalize_text maps pandas' NaN for a blank cell to '', so it gets no domain bonus
+    email = normalize_text(lead_data.get("email"))
+    domain = email.rpartition('@')[2]
+    if domain and domain not in config.get('free_email_domains', []):
+        prior += config.get('company_domain_weight', 0)
+    for column, weights in config.get('crm_weights', {}).items():
+        value = lead.get("crm", {}).get(column)
+        prior += weights.get(str(value).lower(), 0) if value is not None else 0
+    return prior
+
+
+class BudgetGovernor:
+    """Hard per-run token/dollar budget and deadline.
+
+    `level` is the largest fraction of any limit used so far. Each entry of
+    `degrade` switches on an action once the level reaches its `at` value;
+    reaching 1.0 always stops new work."""
+
+    def __init__(self, config: Optional[Dict] = None, prices: Optional[Dict] = None):
+        config = config or {}
+        self.max_tokens = config.get('max_tokens')
+        self.max_dollars = config.get('max_dollars')
+        self.deadline = config.get('deadline_seconds')
+        self.cheap_model = config.get('cheap_model')
+        self.degrade: List[Dict] = config.get('degrade', [])
+        for step in self.degrade:
+            if step['action'] not in ACTIONS:
+                raise ValueError(f"Unknown budget action '{step['action']}'. Expected one of: {', '.join(ACTIONS)}.")
+        self.prices = prices or {}
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.dollars = 0.0
+        self.triggered: Dict[str, float] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def charge(self, total_tokens: int, model: str):
+        self.tokens += total_tokens
+        self.dollars += self.prices.get(model, 0.0) * total_tokens / 1_000_000
+
+    def level(self) -> float:
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(self.tokens / self.max_tokens)
+        if self.max_dollars:
+            fractions.append(self.dollars / self.max_dollars)
+        if self.deadline:
+            fractions.append((time.monotonic() - self.started) / self.deadline)
+        return max(fractions)
+
+    def active(self, action: str) -> bool:
+        level = self.level()
+        on = (action == 'stop' and level >= 1.0) or any(
+            step['action'] == action and level >= step['at'] for step in self.degrade
+        )
+        if on and action not in self.triggered:
+            self.triggered[action] = time.monotonic() - self.started
+        return on
+
+    def skip(self, what: str):
+        self.skipped[what] = self.skipped.get(what, 0) + 1
+
+    def report(self) -> Dict:
+        return {
+            "tokens": self.tokens,
+            "dollars": round(self.dollars, 6),
+            "elapsed": time.monotonic() - self.started,
+            "level": self.level(),
+            "triggered": dict(self.triggered),
+            "skipped": dict(self.skipped),
+        }
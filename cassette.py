@@ -0,0 +1,356 @@
+"""Record a real SalesPipeline run (every LLM call, cascade escalation and
+Serper/scrape tool call, with timings and real token usage) into a versioned
+cassette file, and replay it offline.
+
+    python cassette.py record cassettes/baseline.json
+    python cassette.py replay cassettes/baseline.json --speed 0    # as fast as possible
+    python cassette.py replay cassettes/baseline.json --speed 1    # at recorded speed
+    python cassette.py replay cassettes/baseline.json --dashboard  # through StreamToExpander and the draft panels
+
+Replay matches each request against the recording by content. A request whose
+prompt changed falls back to the next recorded call of the same model or tool
+and is reported as a mismatch, with its estimated prompt-token delta, so prompt
+edits show up as token and latency regressions.
+
+The usage litellm reports is captured from the callbacks crewai passes to
+LLM.call (the agents' TokenCalcHandler) and fed back into them on replay, so
+crew token_usage, budgets and routing costs see the recorded numbers. Replayed
+calls also emit crewai's LLM events, streaming the response in chunks when the
+LLM streams."""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from model_router import ModelRouter, estimate_tokens
+
+CASSETTE_VERSION = 2
+
+MODEL_KINDS = ('llm', 'escalation')
+
+
+def request_key(request: Dict) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def patch_targets():
+    """(kind, class, method) for every call the cassette intercepts."""
+    from crewai import LLM
+    from crewai_tools import ScrapeWebsiteTool, SerperDevTool
+    return [
+        ('llm', LLM, 'call'),
+        ('escalation', ModelRouter, '_escalate'),
+        ('tool', SerperDevTool, '_run'),
+        ('tool', ScrapeWebsiteTool, '_run'),
+    ]
+
+
+def describe_call(kind: str, instance, args, kwargs) -> Dict:
+    if kind == 'llm':
+        messages = kwargs.get('messages', args[0] if args else None)
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        return {"kind": kind, "name": instance.model, "messages": messages}
+    if kind == 'escalation':
+        model, output = args[:2]
+        return {"kind": kind, "name": model, "messages": [{"role": "user", "content": f"{output.description}\n\n{output.raw}"}]}
+    return {"kind": kind, "name": type(instance).__name__, "args": list(args), "kwargs": kwargs}
+
+
+def prompt_tokens(request: Dict) -> int:
+    """Estimated from the prompt text, so a changed prompt can be compared with the recorded one."""
+    if request["kind"] not in MODEL_KINDS:
+        return 0
+    return estimate_tokens(''.join(str(message.get('content', '')) for message in request["messages"] or []))
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, speed: float = 0.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.interactions: List[Dict] = []
+        self.mismatches: List[Dict] = []
+        self.started = None
+        self.elapsed = None
+        self._lock = threading.Lock()
+        self._originals = []
+        self._by_key = defaultdict(deque)
+        self._by_name = defaultdict(deque)
+        # Usage reported to the LLM.call callbacks on this thread while recording
+        self._local = threading.local()
+        self._tapped = {}
+        if mode == 'replay':
+            self._load()
+
+    @classmethod
+    def record(cls, path: str) -> 'Cassette':
+        return cls(path, 'record')
+
+    @classmethod
+    def replay(cls, path: str, speed: float = 0.0) -> 'Cassette':
+        """speed 0 replays as fast as possible, 1 at recorded latency, 2 at half of it, and so on."""
+        return cls(path, 'replay', speed)
+
+    def _load(self):
+        with open(self.path) as file:
+            data = json.load(file)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Cassette {self.path} has version {data.get('version')}, expected {CASSETTE_VERSION}.")
+        self.recorded = data
+        for index, interaction in enumerate(data["interactions"]):
+            self._by_key[interaction["key"]].append(index)
+            self._by_name[(interaction["request"]["kind"], interaction["request"]["name"])].append(index)
+        self._used = set()
+
+    def _next_unused(self, indices: deque) -> Optional[int]:
+        while indices:
+            index = indices.popleft()
+            if index not in self._used:
+                self._used.add(index)
+                return index
+        return None
+
+    def _tap(self, callbacks):
+        """Wrap each callback's log_success_event so the usage litellm reports
+        for the call on this thread is recorded too. The callback objects stay
+        the same, so crewai and litellm treat them exactly as before."""
+        for callback in callbacks or ():
+            if not hasattr(callback, 'log_success_event') or id(callback) in self._tapped:
+                continue
+            original = callback.log_success_event
+
+            def log_success_event(kwargs, response_obj, start_time, end_time, _original=original):
+                if getattr(self._local, 'recording', False) and self._local.usage is None:
+                    usage = response_obj.get('usage') if isinstance(response_obj, dict) else getattr(response_obj, 'usage', None)
+                    self._local.usage = usage_dict(usage)
+                return _original(kwargs, response_obj, start_time, end_time)
+
+            callback.log_success_event = log_success_event
+            self._tapped[id(callback)] = callback
+
+    def _intercept(self, kind: str, original):
+        cassette = self
+        signature = inspect.signature(original)
+
+        def wrapper(instance, *args, **kwargs):
+            request = describe_call(kind, instance, args, kwargs)
+            key = request_key(request)
+            callbacks = signature.bind(instance, *args, **kwargs).arguments.get('callbacks') if kind == 'llm' else None
+            if cassette.mode == 'record':
+                cassette._tap(callbacks)
+                cassette._local.recording, cassette._local.usage = True, None
+                started = time.perf_counter()
+                try:
+                    response = original(instance, *args, **kwargs)
+                finally:
+                    cassette._local.recording = False
+                latency = time.perf_counter() - started
+                if kind == 'escalation':
+                    content, usage = response
+                    cassette._add(request, key, content, latency, usage_dict(usage))
+                else:
+                    cassette._add(request, key, response, latency, cassette._local.usage)
+                return response
+            return cassette._play(instance, request, key, callbacks)
+
+        return wrapper
+
+    def _add(self, request: Dict, key: str, response, latency: float, usage: Optional[Dict] = None):
+        interaction = {
+            "key": key,
+            "request": request,
+            "response": response,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens(request),
+            "completion_tokens": estimate_tokens(str(response)) if request["kind"] in MODEL_KINDS else 0,
+            # Real usage as reported by the provider (None for tools)
+            "usage": usage,
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def _play(self, instance, request: Dict, key: str, callbacks=None):
+        with self._lock:
+            index = self._next_unused(self._by_key[key])
+            if index is None:
+                index = self._next_unused(self._by_name[(request["kind"], request["name"])])
+                if index is None:
+                    raise LookupError(f"Cassette {self.path} has no recorded {request['kind']} call left for {request['name']}.")
+                recorded = self.recorded["interactions"][index]
+                self.mismatches.append({
+                    "name": request["name"],
+                    "recorded_index": index,
+                    "prompt_tokens_delta": prompt_tokens(request) - recorded["prompt_tokens"],
+                })
+            interaction = self.recorded["interactions"][index]
+            self.interactions.append({**interaction, "current_prompt_tokens": prompt_tokens(request)})
+        delay = interaction["latency"] / self.speed if self.speed else 0.0
+        response = interaction["response"]
+        if request["kind"] == 'escalation':
+            time.sleep(delay)
+            return response, usage_object(interaction["usage"])
+        if request["kind"] == 'tool':
+            time.sleep(delay)
+            return response
+        if not emit_llm_events(instance, request["messages"], response, delay):
+            time.sleep(delay)
+        if interaction["usage"]:
+            # What crewai does after a real completion; this is how agents count tokens
+            for callback in callbacks or ():
+                if hasattr(callback, 'log_success_event'):
+                    callback.log_success_event(
+                        kwargs={"model": request["name"], "messages": request["messages"]},
+                        response_obj={"usage": usage_object(interaction["usage"])},
+                        start_time=0, end_time=0,
+                    )
+        return response
+
+    def __enter__(self):
+        for kind, cls, method in patch_targets():
+            original = getattr(cls, method)
+            self._originals.append((cls, method, original))
+            setattr(cls, method, self._intercept(kind, original))
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.started
+        for cls, method, original in reversed(self._originals):
+            setattr(cls, method, original)
+        self._originals = []
+        for callback in self._tapped.values():
+            del callback.log_success_event  # Drop the instance attribute, exposing the class method again
+        self._tapped = {}
+        if self.mode == 'record' and exc_type is None:
+            self.save()
+        return False
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w") as file:
+            json.dump({
+                "version": CASSETTE_VERSION,
+                "recorded_at": time.time(),
+                "wall_time": self.elapsed,
+                "interactions": self.interactions,
+            }, file, indent=1, default=str)
+
+    def report(self) -> Dict:
+        """Recorded usage is what the provider billed; `*_estimated` and
+        `current_prompt_tokens` are text-length estimates, comparable with each other."""
+        model_calls = [i for i in self.interactions if i["request"]["kind"] in MODEL_KINDS]
+        usage = [i["usage"] or {} for i in model_calls]
+        report = {
+            "mode": self.mode,
+            "calls": len(self.interactions),
+            "llm_calls": sum(1 for i in model_calls if i["request"]["kind"] == 'llm'),
+            "escalations": sum(1 for i in model_calls if i["request"]["kind"] == 'escalation'),
+            "recorded_prompt_tokens": sum(u.get("prompt_tokens", 0) or 0 for u in usage),
+            "recorded_completion_tokens": sum(u.get("completion_tokens", 0) or 0 for u in usage),
+            "recorded_prompt_tokens_estimated": sum(i["prompt_tokens"] for i in model_calls),
+            "completion_tokens_estimated": sum(i["completion_tokens"] for i in model_calls),
+            "calls_without_usage": sum(1 for u in usage if not u),
+            "recorded_latency": sum(i["latency"] for i in self.interactions),
+            "wall_time": self.elapsed,
+        }
+        if self.mode == 'replay':
+            current = sum(i["current_prompt_tokens"] for i in model_calls)
+            report["current_prompt_tokens"] = current
+            report["prompt_tokens_delta"] = current - report["recorded_prompt_tokens_estimated"]
+            report["unused_calls"] = len(self.recorded["interactions"]) - len(self._used)
+            report["mismatches"] = len(self.mismatches)
+            report["recorded_wall_time"] = self.recorded.get("wall_time")
+        return report
+
+
+def usage_dict(usage) -> Optional[Dict]:
+    if usage is None:
+        return None
+    if hasattr(usage, 'model_dump'):
+        return usage.model_dump()
+    if isinstance(usage, dict):
+        return dict(usage)
+    return {field: getattr(usage, field, 0) for field in ('prompt_tokens', 'completion_tokens', 'total_tokens')}
+
+
+def usage_object(usage: Optional[Dict]):
+    """Rebuild a litellm Usage from its recorded dict (attribute access, like the original)."""
+    if usage is None:
+        return None
+    try:
+        from litellm.types.utils import Usage
+        return Usage(**usage)
+    except Exception:
+        details = usage.get("prompt_tokens_details")
+        return SimpleNamespace(**{**usage, "prompt_tokens_details": SimpleNamespace(**details) if isinstance(details, dict) else details})
+
+
+def emit_llm_events(llm, messages, response, delay: float) -> bool:
+    """Emit the events a real LLM.call would: started, the response in chunks
+    when the LLM streams (spread over `delay`), and completed. Returns False
+    when the installed crewai has no LLM events."""
+    try:
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.llm_events import (
+            LLMCallCompletedEvent, LLMCallStartedEvent, LLMCallType, LLMStreamChunkEvent,
+        )
+    except ImportError:
+        return False
+    crewai_event_bus.emit(llm, event=LLMCallStartedEvent(messages=messages))
+    if getattr(llm, 'stream', False):
+        chunks = re.findall(r'\s*\S+', response) or [response]
+        for chunk in chunks:
+            crewai_event_bus.emit(llm, event=LLMStreamChunkEvent(chunk=chunk))
+            if delay:
+                time.sleep(delay / len(chunks))
+    elif delay:
+        time.sleep(delay)
+    crewai_event_bus.emit(llm, event=LLMCallCompletedEvent(response=response, call_type=LLMCallType.LLM_CALL))
+    return True
+
+
+class ConsoleExpander:
+    """Stand-in for the Streamlit container StreamToExpander writes into."""
+
+    def markdown(self, text, unsafe_allow_html=False):
+        sys.__stdout__.write(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0.0)
+    parser.add_argument("--dashboard", action="store_true",
+                        help="route output through StreamToExpander and stream email drafts as app4.py does")
+    args = parser.parse_args()
+
+    from flow_pipeline import SalesPipeline, StreamToExpander
+
+    flow = SalesPipeline()
+    if args.dashboard:
+        from email_stream import DraftStream, attach
+        attach()
+        flow.draft_stream = DraftStream()
+        sys.stdout = StreamToExpander(ConsoleExpander())
+    cassette = Cassette.record(args.path) if args.mode == "record" else Cassette.replay(args.path, args.speed)
+    try:
+        with cassette:
+            flow.kickoff()
+    finally:
+        sys.stdout = sys.__stdout__
+    if args.dashboard:
+        for draft in flow.draft_stream.snapshot().values():
+            print(f"--- {draft['label']} ({'done' if draft['done'] else 'incomplete'})\n{draft['text']}\n")
+    print(json.dumps(cassette.report(), indent=2))
@@ -0,0 +1,223 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+LEAD_FIELDS = ('name', 'job_title', 'company', 'email', 'use_case')
+
+COMPANY_SUFFIXES = re.compile(r'\b(inc|llc|ltd|gmbh|corp|corporation|co|plc|sa|ag)\b\.?')
+COMPANY_TLDS = re.compile(r'\.(ai|com|io|co|net|org|dev|app)$')
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def normalize_text(value) -> str:
+    if value is None or value != value:  # None or NaN from pandas
+        return ''
+    value = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode()
+    return re.sub(r'\s+', ' ', value).strip().lower()
+
+
+def normalize_company(value) -> str:
+    company = COMPANY_TLDS.sub('', normalize_text(value))
+    company = COMPANY_SUFFIXES.sub('', company)
+    return re.sub(r'[^a-z0-9]', '', company)
+
+
+def soundex(word: str) -> str:
+    word = re.sub(r'[^a-z]', '', word)
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for char in word[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(len(a), len(b)) // 2 - 1
+    a_matched = [False] * len(a)
+    b_matched = [False] * len(b)
+    matches = 0
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not b_matched[j] and b[j] == char:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    b_chars = [char for char, matched in zip(b, b_matched) if matched]
+    transpositions = sum(1 for char, other in zip((c for c, m in zip(a, a_matched) if m), b_chars) if char != other) / 2
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+    prefix = 0
+    for char, other in zip(a[:4], b[:4]):
+        if char != other:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def mailbox(local: str) -> str:
+    """Email local part without +tags and separators: john.smith+crm -> johnsmith."""
+    return re.sub(r'[._-]', '', local.partition('+')[0])
+
+
+class NormalizedLead:
+    __slots__ = ('email', 'local', 'mailbox', 'domain', 'name', 'first', 'last', 'company')
+
+    def __init__(self, lead_data: Dict):
+        self.email = normalize_text(lead_data.get('email'))
+        self.local, _, self.domain = self.email.partition('@')
+        self.mailbox = mailbox(self.local)
+        self.name = normalize_text(lead_data.get('name'))
+        parts = self.name.split(' ')
+        self.first = parts[0] if parts else ''
+        self.last = parts[-1] if parts else ''
+        self.company = normalize_company(lead_data.get('company'))
+
+
+class LeadDeduplicator:
+    """Finds near-duplicate leads after fetch_leads and merges each group into one.
+
+    Leads are only compared within blocks that share a cheap key (exact email,
+    email domain + surname sound, company + first-name sound), which keeps the
+    work near-linear in the number of rows; blocks larger than max_block_size
+    are compared only against their nearest neighbours in sorted order.
+
+    Two different mailboxes at the same domain are always different people
+    (mark@acme.com and mary@acme.com), however similar their names. A group
+    only grows when the new pair also matches the group's first lead and no
+    two of its members are such a non-match, so chains of near matches
+    (John, Jon, Jane Smith) do not collapse into one lead."""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.threshold = config.get('threshold', 0.9)
+        self.max_block_size = config.get('max_block_size', 50)
+        self.window = config.get('window', 10)
+        self.merge = config.get('merge', 'most_complete')
+        self.free_email_domains = set(config.get('free_email_domains', []))
+        if self.merge not in ('first', 'most_complete'):
+            raise ValueError(f"Unknown dedup merge strategy '{self.merge}'. Expected 'first' or 'most_complete'.")
+
+    def blocking_keys(self, lead: NormalizedLead) -> List[str]:
+        keys = []
+        if lead.email:
+            keys.append('email:' + lead.email)
+        if lead.domain and lead.domain not in self.free_email_domains:
+            keys.append('domain:' + lead.domain + ':' + soundex(lead.last))
+        if lead.company:
+            keys.append('company:' + lead.company + ':' + soundex(lead.first))
+        return keys
+
+    @staticmethod
+    def distinct(a: NormalizedLead, b: NormalizedLead) -> bool:
+        """Hard non-match: different mailboxes on the same mail domain."""
+        return bool(a.mailbox and b.mailbox and a.domain == b.domain and a.mailbox != b.mailbox)
+
+    def similarity(self, a: NormalizedLead, b: NormalizedLead) -> float:
+        if a.email and a.email == b.email:
+            return 1.0
+        if self.distinct(a, b):
+            return 0.0
+        name = jaro_winkler(a.name, b.name)
+        company = jaro_winkler(a.company, b.company)
+        if not (a.local and b.local):
+            # A missing email says nothing either way: score on name and company alone
+            return (0.5 * name + 0.3 * company) / 0.8
+        local = jaro_winkler(a.local, b.local)
+        return 0.5 * name + 0.3 * company + 0.2 * local
+
+    def candidate_pairs(self, normalized: List[NormalizedLead]):
+        blocks = defaultdict(list)
+        for index, lead in enumerate(normalized):
+            for key in self.blocking_keys(lead):
+                blocks[key].append(index)
+        for members in blocks.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= self.max_block_size:
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        yield first, second
+            else:
+                ordered = sorted(members, key=lambda index: normalized[index].name)
+                for i, first in enumerate(ordered):
+                    for second in ordered[i + 1:i + 1 + self.window]:
+                        yield first, second
+
+    def find_groups(self, leads: List[Dict]) -> List[List[int]]:
+        """Indices of duplicate leads, one list per group of two or more."""
+        normalized = [NormalizedLead(lead["lead_data"]) for lead in leads]
+        parent = list(range(len(leads)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        members = {index: [index] for index in range(len(leads))}
+
+        def can_merge(root_first, root_second):
+            if self.similarity(normalized[root_first], normalized[root_second]) < self.threshold:
+                return False
+            return not any(
+                self.distinct(normalized[a], normalized[b])
+                for a in members[root_first] for b in members[root_second]
+            )
+
+        for first, second in self.candidate_pairs(normalized):
+            root_first, root_second = find(first), find(second)
+            if root_first == root_second or self.similarity(normalized[first], normalized[second]) < self.threshold:
+                continue
+            if not can_merge(root_first, root_second):
+                continue
+            root, other = min(root_first, root_second), max(root_first, root_second)
+            parent[other] = root
+            members[root].extend(members.pop(other))
+
+        groups = defaultdict(list)
+        for index in range(len(leads)):
+            groups[find(index)].append(index)
+        return [members for members in groups.values() if len(members) > 1]
+
+    def merge_group(self, group: List[Dict]) -> Dict:
+        if self.merge == 'most_complete':
+            group = sorted(group, key=lambda lead: -sum(1 for field in LEAD_FIELDS if normalize_text(lead["lead_data"].get(field))))
+        merged = {}
+        for field in LEAD_FIELDS:
+            values = [lead["lead_data"].get(field) for lead in group]
+            value = next((v for v in values if normalize_text(v)), values[0])
+            merged[field] = value.strip() if isinstance(value, str) else value
+        merged['email'] = normalize_text(merged['email']) or merged['email']
+        return {**group[0], "lead_data": merged}
+
+    def deduplicate(self, leads: List[Dict]) -> Tuple[List[Dict], List[List[int]]]:
+        """Return the merged lead list (in first-seen order) and the duplicate groups found."""
+        if not self.enabled:
+            return leads, []
+        groups = self.find_groups(leads)
+        group_of = {index: group for group in groups for index in group}
+        deduplicated = []
+        for index, lead in enumerate(leads):
+            group = group_of.get(index)
+            if group is None:
+                deduplicated.append(lead)
+            elif group[0] == index:
+                deduplicated.append(self.merge_group([leads[member] for member in group]))
+        return deduplicated, groups
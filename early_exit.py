@@ -0,0 +1,56 @@
+import operator
+from collections import Counter
+from typing import Dict, List, Optional
+
+OPERATORS = {
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'eq': operator.eq,
+    'ne': operator.ne,
+}
+
+
+class EarlyExitRules:
+    """Early-exit rules for the lead scoring crew, read from the `early_exit`
+    section of config/pipeline.yaml. Each rule compares one field of the
+    structured lead_data_collection output (e.g. personal_info.role_relevance)
+    against a value; the first rule that matches short-circuits the crew and
+    assigns its fixed low score."""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self.enabled = config.get('enabled', False)
+        self.rules: List[Dict] = config.get('rules', [])
+        for rule in self.rules:
+            if rule['op'] not in OPERATORS:
+                raise ValueError(f"Unknown operator '{rule['op']}' in early exit rule '{rule['name']}'.")
+
+    def match(self, report) -> Optional[Dict]:
+        """Return the first rule matched by a LeadDataReport, or None."""
+        if not self.enabled or report is None:
+            return None
+        for rule in self.rules:
+            value = report
+            for part in rule['field'].split('.'):
+                value = getattr(value, part, None)
+            if value is not None and OPERATORS[rule['op']](value, rule['value']):
+                return rule
+        return None
+
+    def should_continue(self, output) -> bool:
+        """ConditionalTask condition for cultural_fit_analysis."""
+        return self.match(output.pydantic) is None
+
+
+def skip_report(matches: List[Optional[Dict]]) -> Dict:
+    """Summarise the rule matched for each lead of a run (None when the lead was scored in full)."""
+    skipped = Counter(rule['name'] for rule in matches if rule is not None)
+    total_skipped = sum(skipped.values())
+    return {
+        "total": len(matches),
+        "skipped": total_skipped,
+        "skip_rate": total_skipped / len(matches) if matches else 0.0,
+        "rules": dict(skipped),
+    }
@@ -0,0 +1,90 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from model_router import estimate_tokens
+
+STOPWORDS = {'a', 'an', 'and', 'the', 'to', 'for', 'of', 'in', 'on', 'with', 'using', 'use', 'do', 'better', 'our', 'we'}
+
+
+def use_case_terms(use_case) -> frozenset:
+    if not isinstance(use_case, str):
+        return frozenset()
+    return frozenset(word for word in re.findall(r'[a-z0-9]+', use_case.lower()) if word not in STOPWORDS)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class EmailCluster:
+    __slots__ = ('industry', 'use_case', 'terms', 'records')
+
+    def __init__(self, industry: str, use_case: str, terms: frozenset):
+        self.industry = industry
+        self.use_case = use_case
+        self.terms = terms
+        self.records = []
+
+    def inputs(self, max_companies: int = 5) -> Dict:
+        """Inputs for cluster_email_crew."""
+        return {
+            "industry": self.industry,
+            "use_case": self.use_case,
+            "companies": ', '.join(record.company_name for record in self.records[:max_companies]),
+        }
+
+
+def cluster_records(records, use_cases: Dict[int, str], threshold: float = 0.5) -> List[EmailCluster]:
+    """Group LeadRecords by industry, then greedily by use-case term overlap with
+    each cluster's first member. `use_cases` maps record.index to the lead's use case."""
+    by_industry = defaultdict(list)
+    for record in records:
+        by_industry[(record.industry or '').strip().lower()].append(record)
+    clusters = []
+    for industry_records in by_industry.values():
+        industry_clusters = []
+        for record in industry_records:
+            use_case = use_cases.get(record.index)
+            terms = use_case_terms(use_case)
+            cluster = max(industry_clusters, key=lambda c: jaccard(c.terms, terms), default=None)
+            if cluster is None or jaccard(cluster.terms, terms) < threshold:
+                cluster = EmailCluster(record.industry, use_case, terms)
+                industry_clusters.append(cluster)
+            cluster.records.append(record)
+        clusters.extend(industry_clusters)
+    return clusters
+
+
+def personalization_messages(task_config: Dict, base_draft: str, record) -> List[Dict]:
+    inputs = record.email_inputs()
+    prompt = task_config['description'].format(
+        base_draft=base_draft,
+        personal_info=inputs['personal_info'],
+        company_info=inputs['company_info'],
+    )
+    return [
+        {"role": "system", "content": "You personalize sales emails with minimal edits."},
+        {"role": "user", "content": f"{prompt}\n\nExpected output: {task_config['expected_output']}"},
+    ]
+
+
+def call_usage(summary, messages: List[Dict], email: str) -> tuple:
+    """Usage of one personalization call, in lead_records.USAGE_FIELDS order: the
+    real usage litellm reported to the call's TokenCalcHandler, or an estimate
+    from the text when the provider reported none."""
+    if summary is not None and summary.successful_requests:
+        return (summary.total_tokens, summary.prompt_tokens, summary.cached_prompt_tokens,
+                summary.completion_tokens, summary.successful_requests)
+    prompt = estimate_tokens(''.join(message['content'] for message in messages))
+    completion = estimate_tokens(email)
+    return (prompt + completion, prompt, 0, completion, 1)
+
+
+def personalization_usage(call: tuple, base_usage: Optional[tuple], group_size: int) -> tuple:
+    """Per-lead usage: this lead's personalization call plus its share of the
+    cluster's base draft crew, in lead_records.USAGE_FIELDS order."""
+    share = [value // group_size for value in base_usage] if base_usage else [0] * 5
+    return tuple(value + part for value, part in zip(call, share))
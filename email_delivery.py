@@ -0,0 +1,309 @@
+import hashlib
+import logging
+import os
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(recipient: str, campaign: str) -> str:
+    """One delivery per recipient and campaign. The body is left out on purpose:
+    it is regenerated by the LLM on every run and would never match."""
+    return hashlib.sha256(f"{recipient.strip().lower()}\n{campaign}".encode()).hexdigest()
+
+
+class DeliveryLedger:
+    """SQLite record of every delivery attempt, keyed by idempotency key, so a
+    resumed run never sends the same email twice.
+
+    A sender must `claim` a key before sending. Statuses: `sending` (claimed),
+    `sent`, `rejected` (permanent failure) and `failed` (temporary failures
+    exhausted; claimable again by a later run)."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                " key TEXT PRIMARY KEY, recipient TEXT, status TEXT, attempts INTEGER,"
+                " error TEXT, message_id TEXT, updated_at REAL)"
+            )
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, recipient, status, attempts, error, message_id, updated_at FROM deliveries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("key", "recipient", "status", "attempts", "error", "message_id", "updated_at"), row))
+
+    def claim(self, key: str, recipient: str, stale_after: float) -> bool:
+        """Atomically take ownership of `key`. Succeeds for a new key, a `failed`
+        one, or a `sending` claim older than `stale_after` seconds (its sender died)."""
+        now = time.time()
+        with self._lock, self._conn:
+            inserted = self._conn.execute(
+                "INSERT INTO deliveries (key, recipient, status, attempts, updated_at)"
+                " VALUES (?, ?, 'sending', 0, ?) ON CONFLICT(key) DO NOTHING",
+                (key, recipient, now),
+            ).rowcount
+            if inserted:
+                return True
+            return self._conn.execute(
+                "UPDATE deliveries SET status = 'sending', updated_at = ?"
+                " WHERE key = ? AND (status = 'failed' OR (status = 'sending' AND updated_at < ?))",
+                (now, key, now - stale_after),
+            ).rowcount == 1
+
+    def update(self, key: str, recipient: str, status: str, attempts: int, error: Optional[str] = None, message_id: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO deliveries (key, recipient, status, attempts, error, message_id, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET status = excluded.status, attempts = excluded.attempts,"
+                " error = excluded.error, message_id = COALESCE(excluded.message_id, deliveries.message_id),"
+                " updated_at = excluded.updated_at",
+                (key, recipient, status, attempts, error, message_id, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SMTPPool:
+    """Fixed-size pool of persistent SMTP connections. Each connection stays
+    open across many messages (one MAIL/RCPT/DATA transaction after another,
+    no reconnect), and is replaced when the server drops it."""
+
+    def __init__(self, host: str, port: int, size: int = 4, username: Optional[str] = None,
+                 password: Optional[str] = None, starttls: bool = False, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)  # Connections are opened lazily
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        connection.ehlo()
+        if self.starttls:
+            connection.starttls()
+            connection.ehlo()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def send(self, message: EmailMessage):
+        connection = self._idle.get()
+        try:
+            if connection is None:
+                connection = self._connect()
+            connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._discard(connection)
+            connection = None
+            raise
+        except smtplib.SMTPException:
+            # SMTPException subclasses OSError, so it must be handled first: a
+            # refused recipient or message fails the transaction but leaves the
+            # session usable
+            if connection is not None:
+                try:
+                    connection.rset()
+                except (smtplib.SMTPException, OSError):
+                    self._discard(connection)
+                    connection = None
+            raise
+        except OSError:
+            # Socket-level failure: the connection is gone
+            self._discard(connection)
+            connection = None
+            raise
+        finally:
+            self._idle.put(connection)
+
+    def _discard(self, connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection is not None:
+                try:
+                    connection.quit()
+                except smtplib.SMTPException:
+                    connection.close()
+
+
+class DomainLimiter:
+    """Per recipient-domain concurrency cap and minimum spacing between sends."""
+
+    def __init__(self, concurrency: int = 4, rate_per_second: float = 0.0):
+        self.concurrency = concurrency
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self._semaphores = {}
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, domain: str):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(domain, threading.BoundedSemaphore(self.concurrency))
+        semaphore.acquire()
+        if self.interval:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(domain, now))
+                self._next_slot[domain] = slot + self.interval
+            if slot > now:
+                time.sleep(slot - now)
+
+    def release(self, domain: str):
+        self._semaphores[domain].release()
+
+
+def is_temporary(error: Exception) -> bool:
+    """4xx replies and lost connections are retried; 5xx replies and other
+    protocol errors are permanent."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+class EmailDelivery:
+    """Sends emails through an SMTPPool from a thread pool, honouring per-domain
+    limits, retrying temporary failures with backoff, and recording the status
+    of every message in a DeliveryLedger."""
+
+    def __init__(self, config: Dict):
+        self.sender = os.getenv('SMTP_FROM', config.get('sender'))
+        self.subject = config.get('subject', '')
+        # Each recipient gets at most one email per campaign
+        self.campaign = config.get('campaign') or self.subject
+        self.claim_timeout = config.get('claim_timeout', 600)
+        self.workers = config.get('workers', 16)
+        self.max_retries = config.get('max_retries', 3)
+        self.backoff = config.get('backoff', 1.0)
+        self.pool = SMTPPool(
+            os.getenv('SMTP_HOST', config.get('host', 'localhost')),
+            int(os.getenv('SMTP_PORT', config.get('port', 25))),
+            size=config.get('pool_size', 8),
+            username=os.getenv('SMTP_USERNAME'),
+            password=os.getenv('SMTP_PASSWORD'),
+            starttls=config.get('starttls', False),
+        )
+        self.limiter = DomainLimiter(config.get('per_domain_concurrency', 4), config.get('per_domain_rate', 0.0))
+        self.ledger = DeliveryLedger(config.get('ledger_path', 'delivery/deliveries.db'))
+
+    def build_message(self, recipient: str, body: str, key: str) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Subject'] = self.subject
+        # Derived from the idempotency key, so every retry and resumed run reuses it
+        # and downstream systems can recognise a duplicate
+        message['Message-ID'] = f"<{key[:32]}@{self.sender.split('@')[-1]}>"
+        message['X-Idempotency-Key'] = key
+        message.set_content(body)
+        return message
+
+    def deliver(self, recipient: str, body: str) -> Dict:
+        key = idempotency_key(recipient, self.campaign)
+        if not self.ledger.claim(key, recipient, self.claim_timeout):
+            # Already sent or rejected, or another sender holds the claim
+            existing = self.ledger.get(key)
+            return {**existing, "status": "skipped_duplicate", "ledger_status": existing['status']}
+        attempts = self.ledger.get(key)['attempts']
+        message = self.build_message(recipient, body, key)
+        domain = recipient.rsplit('@', 1)[-1].lower()
+        error = None
+        for retry in range(self.max_retries + 1):
+            attempts += 1
+            self.limiter.acquire(domain)
+            try:
+                self.pool.send(message)
+            except Exception as exc:
+                error = exc
+            else:
+                self.ledger.update(key, recipient, 'sent', attempts, message_id=message['Message-ID'])
+                return {"key": key, "recipient": recipient, "status": "sent", "attempts": attempts}
+            finally:
+                self.limiter.release(domain)
+            if not is_temporary(error):
+                break
+            # Still claimed; refreshing updated_at keeps the claim from going stale
+            self.ledger.update(key, recipient, 'sending', attempts, error=str(error))
+            time.sleep(self.backoff * (2 ** retry))
+        status = 'failed' if is_temporary(error) else 'rejected'
+        self.ledger.update(key, recipient, status, attempts, error=str(error))
+        logger.warning("Delivery to %s %s after %d attempts: %s", recipient, status, attempts, error)
+        return {"key": key, "recipient": recipient, "status": status, "attempts": attempts, "error": str(error)}
+
+    def deliver_all(self, messages: List[Dict]) -> List[Dict]:
+        """Send [{"recipient": ..., "body": ...}, ...]; returns one status record per message, in order."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda m: self.deliver(m['recipient'], m['body']), messages))
+
+    def close(self):
+        self.pool.close()
+        self.ledger.close()
+
+
+if __name__ == "__main__":
+    # End-to-end throughput check against a local aiosmtpd stand-in:
+    #   python email_delivery.py 5000
+    import sys
+    import tempfile
+    from aiosmtpd.controller import Controller
+
+    class Sink:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            Sink.received += 1
+            return '250 OK'
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    controller = Controller(Sink(), hostname='127.0.0.1', port=8025)
+    controller.start()
+    ledger_path = os.path.join(tempfile.mkdtemp(), 'deliveries.db')
+    delivery = EmailDelivery({'host': '127.0.0.1', 'port': 8025, 'sender': 'sales@example.com',
+                              'subject': 'Benchmark', 'ledger_path': ledger_path, 'per_domain_concurrency': 16})
+    messages = [{"recipient": f"lead{i}@example{i % 20}.com", "body": f"Hello {i}"} for i in range(count)]
+    started = time.perf_counter()
+    statuses = delivery.deliver_all(messages)
+    elapsed = time.perf_counter() - started
+    resent = delivery.deliver_all(messages[:10])
+    delivery.close()
+    controller.stop()
+    sent = sum(1 for s in statuses if s['status'] == 'sent')
+    print(f"sent {sent}/{count} in {elapsed:.2f}s ({sent / elapsed * 60:.0f} msgs/min), server received {Sink.received}")
+    print(f"resend of 10 already-sent messages: {[s['status'] for s in resent].count('skipped_duplicate')} skipped")
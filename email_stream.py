@@ -0,0 +1,98 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+_current = threading.local()
+_attached = False
+_attach_lock = threading.Lock()
+
+
+class DraftStream:
+    """Per-lead text buffers that email_writing_crew streams tokens into.
+
+    Producers only ever append to a string under a short lock, so a slow
+    dashboard never stalls the crew workers: the reader takes a snapshot
+    whenever it is ready to repaint, and all tokens that arrived since the
+    last repaint are coalesced into a single update."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[str, str] = {}
+        self._chunks: Dict[str, List[str]] = {}
+        self._done: Dict[str, bool] = {}
+        self.version = 0
+
+    def open(self, key: str, label: str):
+        with self._lock:
+            self._labels[key] = label
+            self._chunks[key] = []
+            self._done[key] = False
+            self.version += 1
+
+    def append(self, key: str, token: str):
+        with self._lock:
+            if key in self._chunks:
+                self._chunks[key].append(token)
+                self.version += 1
+
+    def new_segment(self, key: str):
+        """Start a fresh section of the panel, e.g. when the next task of the crew begins."""
+        self.append(key, "\n\n---\n\n")
+
+    def finish(self, key: str, text: str):
+        with self._lock:
+            self._chunks[key] = [text]
+            self._done[key] = True
+            self.version += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                key: {"label": self._labels[key], "text": ''.join(chunks), "done": self._done[key]}
+                for key, chunks in self._chunks.items()
+            }
+
+
+@contextmanager
+def streaming_to(stream: DraftStream, key: str):
+    """Route LLM stream chunks produced on this thread to `key` of `stream`."""
+    previous = getattr(_current, 'target', None)
+    _current.target = (stream, key)
+    try:
+        yield
+    finally:
+        _current.target = previous
+
+
+def attach() -> bool:
+    """Subscribe once to crewai's LLM events. Returns False when the installed
+    crewai has no streaming events, in which case panels only fill when each
+    email is finished."""
+    global _attached
+    with _attach_lock:
+        if _attached:
+            return True
+        try:
+            from crewai.utilities.events import crewai_event_bus
+            from crewai.utilities.events.llm_events import LLMCallStartedEvent, LLMStreamChunkEvent
+        except ImportError:
+            logger.info("crewai LLM streaming events unavailable; email drafts will appear when complete")
+            return False
+
+        @crewai_event_bus.on(LLMStreamChunkEvent)
+        def on_chunk(source, event):
+            target = getattr(_current, 'target', None)
+            if target is not None:
+                target[0].append(target[1], event.chunk)
+
+        @crewai_event_bus.on(LLMCallStartedEvent)
+        def on_call_started(source, event):
+            target = getattr(_current, 'target', None)
+            if target is not None:
+                target[0].new_segment(target[1])
+
+        _attached = True
+        return True
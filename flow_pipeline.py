@@ -1,4 +1,7 @@
 from crewai import Agent, Crew, Process, Task
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
+from crewai.utilities.token_counter_callback import TokenCalcHandler
 from crewai.project import CrewBase, agent, crew, task, before_kickoff, after_kickoff
 from crewai_tools import SerperDevTool, ScrapeWebsiteTool
 from pydantic import BaseModel, Field, ConfigDict
@@ -10,10 +13,25 @@ import warnings
 warnings.filterwarnings("always", module="pydantic")
 import logging
 import re
+import os
 import pandas as pd
 import streamlit as st
-import agentops
-agentops.init("10d2ae41-41a5-468a-a0da-b0ab4225a8b0",skip_auto_end_session=True)
+import telemetry
+from model_router import ModelRouter, validate_structured, validate_text
+from early_exit import EarlyExitRules, skip_report
+from email_delivery import EmailDelivery
+from email_stream import streaming_to
+from lead_records import LeadRecord, TranscriptStore, usage_tuple
+from dedup import LeadDeduplicator
+from email_clusters import call_usage, cluster_records, personalization_messages, personalization_usage
+from budget import BudgetGovernor, lead_prior
+from single_flight import config_version, coordinator, fingerprint
+from importlib.metadata import version
+
+# Verified crewai range (see README): email_stream needs event handlers to run on the emitting thread
+MIN_CREWAI_VERSION, MAX_CREWAI_VERSION = (0, 120), (0, 131)
+if not MIN_CREWAI_VERSION <= tuple(int(part) for part in re.findall(r'\d+', version('crewai'))[:2]) < MAX_CREWAI_VERSION:
+    raise ImportError(f"crewai>=0.120,<0.131 is required, found {version('crewai')}. See requirements.txt.")
 
 logging.basicConfig(
     level=logging.DEBUG
@@ -32,6 +50,11 @@ class CompanyInfo(BaseModel):
     revenue: Optional[float] = Field(None, description="The annual revenue of the company, if available.")
     market_presence: int = Field(ge=0, le=10, description="A score representing the company's market presence (0-10).")
 
+class LeadDataReport(BaseModel):
+    personal_info: LeadPersonalInfo = Field(description="Personal information about the lead.")
+    company_info: CompanyInfo = Field(description="Information about the lead's company.")
+    confidence: int = Field(ge=0, le=10, description="Self-reported confidence in the accuracy of the collected data (0-10).")
+
 class LeadScore(BaseModel):
     score: int = Field(ge=0, le=100, description="The final score assigned to the lead (0-100).")
     scoring_criteria: List[str] = Field(description="The criteria used to determine the lead's score.")
@@ -46,7 +69,8 @@ class LeadScoringResult(BaseModel):
         # Define file paths for YAML configurations
 files = {
         'agents': 'config/agents.yaml',
-        'tasks': 'config/tasks.yaml'
+        'tasks': 'config/tasks.yaml',
+        'pipeline': 'config/pipeline.yaml'
     }
 # Load configurations from YAML files
 configs = {}
@@ -56,6 +80,21 @@ for config_type, file_path in files.items():
 
 agents_config = configs['agents']
 tasks_config = configs['tasks']
+pipeline_config = configs['pipeline']
+
+# Work is only shared between dashboard sessions running the same configuration
+CONFIG_VERSION = config_version(files.values())
+
+# Telemetry is buffered and flushed from a background thread, so recording never blocks a crew step
+tracker = telemetry.init(pipeline_config.get('telemetry'))
+
+# Per-agent models from agents.yaml, with escalation to a stronger model for agents that declare a cascade
+router = ModelRouter(agents_config, pipeline_config.get('models'))
+# crewai falls back to OPENAI_MODEL_NAME for internal calls that have no agent LLM
+os.environ.setdefault('OPENAI_MODEL_NAME', router.default_model)
+
+# Rules that short-circuit the scoring crew on the structured lead_data_collection output
+early_exit_rules = EarlyExitRules(pipeline_config.get('early_exit'))
 
 class StreamToExpander:
     def __init__(self, expander):
@@ -108,19 +147,22 @@ class StreamToExpander:
 
 # Creating Agents
 lead_data_agent = Agent(
-  config=agents_config['lead_data_agent'],
+  config=router.agent_config('lead_data_agent'),
+  llm=router.agent_llm('lead_data_agent'),
   tools=[SerperDevTool(), ScrapeWebsiteTool()],
   step_callback=StreamToExpander
 )
 
 cultural_fit_agent = Agent(
-  config=agents_config['cultural_fit_agent'],
+  config=router.agent_config('cultural_fit_agent'),
+  llm=router.agent_llm('cultural_fit_agent'),
   tools=[SerperDevTool(), ScrapeWebsiteTool()],
   step_callback=StreamToExpander
 )
 
 scoring_validation_agent = Agent(
-  config=agents_config['scoring_validation_agent'],
+  config=router.agent_config('scoring_validation_agent'),
+  llm=router.agent_llm('scoring_validation_agent'),
   tools=[SerperDevTool(), ScrapeWebsiteTool()],
   step_callback=StreamToExpander
 )
@@ -129,18 +171,23 @@ scoring_validation_agent = Agent(
 lead_data_task = Task(
   config=tasks_config['lead_data_collection'],
   agent=lead_data_agent,
+  output_pydantic=LeadDataReport,
+  guardrail=router.cascade('lead_data_agent', validate_structured, LeadDataReport),
 )
 
-cultural_fit_task = Task(
+cultural_fit_task = ConditionalTask(
   config=tasks_config['cultural_fit_analysis'],
   agent=cultural_fit_agent,
+  condition=early_exit_rules.should_continue,
 )
 
-scoring_validation_task = Task(
+# A skipped cultural fit task leaves an empty output, so validation only runs when it did
+scoring_validation_task = ConditionalTask(
   config=tasks_config['lead_scoring_and_validation'],
   agent=scoring_validation_agent,
   context=[lead_data_task, cultural_fit_task],
   output_pydantic=LeadScoringResult,
+  condition=lambda output: bool(output.raw),
 )
 
 # Creating Crew
@@ -161,12 +208,14 @@ lead_scoring_crew = Crew(
 
 # Creating Agents
 email_content_specialist = Agent(
-  config=agents_config['email_content_specialist'],
+  config=router.agent_config('email_content_specialist'),
+  llm=router.agent_llm('email_content_specialist'),
   step_callback=StreamToExpander
 )
 
 engagement_strategist = Agent(
-  config=agents_config['engagement_strategist'],
+  config=router.agent_config('engagement_strategist'),
+  llm=router.agent_llm('engagement_strategist'),
   step_callback=StreamToExpander
 )
 
@@ -174,6 +223,7 @@ engagement_strategist = Agent(
 email_drafting = Task(
   config=tasks_config['email_drafting'],
   agent=email_content_specialist,
+  guardrail=router.cascade('email_content_specialist', validate_text),
 )
 
 engagement_optimization = Task(
@@ -194,9 +244,118 @@ email_writing_crew = Crew(
   verbose=True
 )
 
+# Group-level base drafts for clustered email generation, personalized per lead afterwards
+cluster_email_drafting = Task(
+  config=tasks_config['cluster_email_drafting'],
+  agent=email_content_specialist,
+  guardrail=router.cascade('email_content_specialist', validate_text),
+)
+
+cluster_engagement_optimization = Task(
+  config=tasks_config['cluster_engagement_optimization'],
+  agent=engagement_strategist,
+)
+
+cluster_email_crew = Crew(
+    agents=[
+    email_content_specialist,
+    engagement_strategist
+  ],
+  tasks=[
+    cluster_email_drafting,
+    cluster_engagement_optimization
+  ],
+  verbose=True
+)
+
+# Draft-only cluster crew, used once the budget governor skips engagement optimization
+cluster_email_draft_only = Task(
+  config=tasks_config['cluster_email_drafting'],
+  agent=email_content_specialist,
+  guardrail=router.cascade('email_content_specialist', validate_text),
+)
+
+cluster_email_draft_crew = Crew(
+  agents=[email_content_specialist],
+  tasks=[cluster_email_draft_only],
+  verbose=True
+)
+
+
+
+# Draft-only email crew, used once the budget governor skips engagement optimization
+email_draft_only = Task(
+  config=tasks_config['email_drafting'],
+  agent=email_content_specialist,
+  guardrail=router.cascade('email_content_specialist', validate_text),
+)
+
+email_draft_crew = Crew(
+  agents=[email_content_specialist],
+  tasks=[email_draft_only],
+  verbose=True
+)
+
+
+def governed_crew(crew: Crew, governor: BudgetGovernor) -> Tuple[Crew, str]:
+    """Copy of `crew` for one kickoff, moved to the budget's cheap model once that
+    degrade step is active. Returns the crew and the model it runs on (the
+    default model when agents keep their own)."""
+    crew = crew.copy()
+    if governor.cheap_model and governor.active('cheap_model'):
+        for crew_agent in crew.agents:
+            crew_agent.llm = router.llm(governor.cheap_model, stream=getattr(crew_agent.llm, 'stream', False))
+        return crew, governor.cheap_model
+    return crew, router.default_model
+
+
+def governed_llm(agent_name: str, governor: BudgetGovernor, stream: bool = False):
+    """LLM for a direct call on behalf of `agent_name`, following the same degrade steps as governed_crew."""
+    if governor.cheap_model and governor.active('cheap_model'):
+        return router.llm(governor.cheap_model, stream=stream)
+    return router.llm(router.model_for(agent_name), stream=stream)
+
+
+def early_exit_score(report: LeadDataReport, rule: Dict) -> LeadScoringResult:
+    """Cheap low score for a lead that matched an early exit rule, built without an LLM call."""
+    return LeadScoringResult(
+        personal_info=report.personal_info,
+        company_info=report.company_info,
+        lead_score=LeadScore(
+            score=rule['score'],
+            scoring_criteria=[f"Early exit: {rule['name']} ({rule['field']} {rule['op']} {rule['value']})"],
+            validation_notes="Cultural fit analysis and scoring validation were skipped by an early exit rule.",
+        ),
+    )
 
 
 class SalesPipeline(Flow):
+    # Set by the dashboard to receive email drafts token by token
+    draft_stream = None
+    # Transcript file of the current run, opened by score_leads
+    transcripts = None
+
+    def run_crew(self, crew, inputs):
+        """Kick off `crew`, recording its routing decisions in this run's log and
+        charging each agent's usage to the budget at the price of its own model.
+        Escalations are charged by the routing log as they happen."""
+        with router.tracking(self.routing):
+            output = crew.kickoff(inputs=inputs)
+        self.routing.settle(crew, agents_config)
+        for crew_agent in crew.agents:
+            token_process = getattr(crew_agent, '_token_process', None)
+            if token_process is not None:
+                self.governor.charge(token_process.get_summary().total_tokens, getattr(crew_agent.llm, 'model', router.default_model))
+        return output
+
+    def shared_work(self, kind, payload, fn, index=None):
+        """Run `fn` through the process-wide single-flight coordinator, so concurrent
+        dashboard sessions asking for the same work attach to one run of it."""
+        result, shared = coordinator.do(f"{kind}:{CONFIG_VERSION}:{fingerprint(payload)}", fn)
+        if shared:
+            self.state["shared_work"].append({"kind": kind, "lead": index})
+        return result, shared
+
     @start()
     def fetch_leads(self):
       # Specify the path to your Excel file
@@ -208,6 +367,9 @@ class SalesPipeline(Flow):
       except FileNotFoundError:
           raise FileNotFoundError(f"Excel file not found at {excel_file_path}. Please check the path.")
       
+      # Optional CRM columns feed the scheduling prior
+      crm_columns = [column for column in pipeline_config.get('budget', {}).get('crm_weights', {}) if column in leads_df.columns]
+
       # Convert the DataFrame to the required format
       leads = []
       for _, row in leads_df.iterrows():
@@ -220,8 +382,18 @@ class SalesPipeline(Flow):
                   "use_case": row["usecase"]
               },
           }
+          if crm_columns:
+              lead["crm"] = {column: row[column] for column in crm_columns}
           leads.append(lead)
-    
+
+      # Budget and deadline apply to the whole run, starting now
+      self.governor = BudgetGovernor(pipeline_config.get('budget'), router.prices)
+      self.state["shared_work"] = []
+      # Escalations are charged to the budget and stop once the cheap_model step is reached
+      self.routing = router.new_log(self.governor)
+      # Per-run session id: the tracker is shared by every dashboard session in the process
+      self.session_id = tracker.start_session(tags=["sales_pipeline"])
+      tracker.record("fetch_leads", self.session_id, source=excel_file_path, count=len(leads))
       return leads
     # def fetch_leads(self):
         # Pull our leads from the database
@@ -248,28 +420,178 @@ class SalesPipeline(Flow):
         # return leads
 
     @listen(fetch_leads)
+    def dedup_leads(self, leads):
+        deduplicator = LeadDeduplicator(pipeline_config.get('dedup'))
+        leads, groups = deduplicator.deduplicate(leads)
+        # Indices refer to rows of the lead file; send_email looks leads up in the deduplicated list
+        self.state["duplicate_groups"] = groups
+        self.state["leads"] = leads
+        tracker.record("dedup_leads", self.session_id, groups=len(groups), removed=sum(len(group) - 1 for group in groups))
+        return leads
+
+    @listen(dedup_leads)
     def score_leads(self, leads):
-        scores = lead_scoring_crew.kickoff_for_each(leads)
-        self.state["score_crews_results"] = scores
-        return scores
+        # Highest-value leads first, so a budget or deadline cut only drops the least promising ones
+        budget_config = pipeline_config.get('budget', {})
+        leads = sorted(leads, key=lambda lead: lead_prior(lead, budget_config), reverse=True)
+        self.state["leads"] = leads
+        # Compact each lead's result as soon as its crew finishes; full transcripts go to disk
+        records_config = pipeline_config.get('records', {})
+        # Kept on the flow rather than in state or on records: state is deep-copied and the store holds a lock
+        self.transcripts = TranscriptStore(records_config.get('transcript_dir', 'transcripts'), keep_runs=records_config.get('keep_runs', 20))
+        records = []
+        matches = []
+        for index, lead in enumerate(leads):
+            if self.governor.active('stop'):
+                self.governor.skip('scoring')
+                continue
+            crew, model = governed_crew(lead_scoring_crew, self.governor)
+            score, shared = self.shared_work("score", {"lead": lead, "model": model}, lambda: self.run_crew(crew, lead), index)
+            report = score.tasks_output[0].pydantic
+            rule = early_exit_rules.match(report)
+            result = early_exit_score(report, rule) if rule is not None else score.pydantic
+            if result is None:
+                logging.warning("Lead %d produced no valid LeadScoringResult; skipping it", index)
+                continue
+            # Only leads that produced a result count towards the skip rate
+            matches.append(rule)
+            record = LeadRecord.from_crew_output(index, score, result, self.transcripts, rule['name'] if rule else None)
+            if shared:
+                record.shared = ("scoring",)
+            records.append(record)
+        self.state["score_crews_results"] = records
+        self.state["early_exit"] = skip_report(matches)
+        tracker.record("score_leads", self.session_id, count=len(records))
+        tracker.record("early_exit", self.session_id, **self.state["early_exit"])
+        return records
 
     @listen(score_leads)
-    def store_leads_score(self, scores):
+    def store_leads_score(self, records):
         # Here we would store the scores in the database
-        return scores
+        return records
 
     @listen(score_leads)
-    def filter_leads(self, scores):
-        return [score for score in scores if score['lead_score'].score >= 60]
+    def filter_leads(self, records):
+        filtered = [record for record in records if record.score >= 60]
+        self.state["filtered_leads"] = filtered
+        return filtered
+
+    def write_lead_email(self, record):
+        if self.governor.active('skip_optimization'):
+            self.governor.skip('optimization')
+            variant, (crew, model) = "draft", governed_crew(email_draft_crew, self.governor)
+        else:
+            variant, (crew, model) = "full", governed_crew(email_writing_crew, self.governor)
+        inputs = record.email_inputs()
+        payload = {"inputs": inputs, "crew": variant, "model": model}
+        # Same as kickoff_for_each, but each lead's crew streams into its own panel
+        if self.draft_stream is None:
+            email, shared = self.shared_work("email", payload, lambda: self.run_crew(crew, inputs), record.index)
+        else:
+            key = f"lead-{record.index}"
+            self.draft_stream.open(key, f"{record.name} - {record.company_name}")
+            with streaming_to(self.draft_stream, key):
+                email, shared = self.shared_work("email", payload, lambda: self.run_crew(crew, inputs), record.index)
+            self.draft_stream.finish(key, email.raw)
+        if shared:
+            record.shared += ("email",)
+        record.attach_email(email, self.transcripts)
+
+    def personalize_email(self, record, base_draft, base_usage, group_size, llm):
+        messages = personalization_messages(tasks_config['email_personalization'], base_draft, record)
+        key = f"lead-{record.index}"
+        payload = {"messages": messages, "model": llm.model}
+
+        def personalize():
+            # The same callback agents count tokens with, so the real usage comes back
+            tokens = TokenProcess()
+            email = llm.call(messages, callbacks=[TokenCalcHandler(tokens)])
+            return email, tokens.get_summary()
+
+        if self.draft_stream is None:
+            (email, summary), shared = self.shared_work("personalize", payload, personalize, record.index)
+        else:
+            self.draft_stream.open(key, f"{record.name} - {record.company_name}")
+            with streaming_to(self.draft_stream, key):
+                (email, summary), shared = self.shared_work("personalize", payload, personalize, record.index)
+            self.draft_stream.finish(key, email)
+        call = call_usage(summary, messages, email)
+        usage = personalization_usage(call, base_usage, group_size)
+        if shared:
+            record.shared += ("email",)
+        else:
+            # The cluster's base crew is charged once, when it runs
+            self.governor.charge(call[0], llm.model)
+        record.attach_personalized_email(email, usage, base_draft, self.transcripts)
 
     @listen(filter_leads)
-    def write_email(self, leads):
-        scored_leads = [lead.to_dict() for lead in leads]
-        emails = email_writing_crew.kickoff_for_each(scored_leads)
-        return emails
+    def write_email(self, records):
+        email_config = pipeline_config.get('email_generation', {})
+        # Best leads get their emails first in case the budget runs out
+        records = sorted(records, key=lambda record: record.score, reverse=True)
+        if email_config.get('mode', 'per_lead') != 'clustered':
+            for record in records:
+                if self.governor.active('stop'):
+                    self.governor.skip('email')
+                    continue
+                self.write_lead_email(record)
+        else:
+            # One optimized base draft per industry/use-case cluster, then a short personalization call per lead
+            use_cases = {record.index: self.state["leads"][record.index]["lead_data"]["use_case"] for record in records}
+            clusters = cluster_records(records, use_cases, email_config.get('similarity_threshold', 0.5))
+            for cluster in clusters:
+                if self.governor.active('stop'):
+                    for record in cluster.records:
+                        self.governor.skip('email')
+                    continue
+                if len(cluster.records) < email_config.get('min_cluster_size', 2):
+                    for record in cluster.records:
+                        if self.governor.active('stop'):
+                            self.governor.skip('email')
+                            continue
+                        self.write_lead_email(record)
+                    continue
+                if self.governor.active('skip_optimization'):
+                    self.governor.skip('optimization')
+                    variant, (crew, model) = "draft", governed_crew(cluster_email_draft_crew, self.governor)
+                else:
+                    variant, (crew, model) = "full", governed_crew(cluster_email_crew, self.governor)
+                inputs = cluster.inputs()
+                base, shared = self.shared_work("cluster", {"inputs": inputs, "crew": variant, "model": model}, lambda: self.run_crew(crew, inputs))
+                base_usage = usage_tuple(base)
+                for record in cluster.records:
+                    # The budget may run out part way through a cluster
+                    if self.governor.active('stop'):
+                        self.governor.skip('email')
+                        continue
+                    llm = governed_llm('email_content_specialist', self.governor, stream=self.draft_stream is not None)
+                    self.personalize_email(record, base.raw, base_usage, len(cluster.records), llm)
+            self.state["email_clusters"] = [[record.index for record in cluster.records] for cluster in clusters]
+            tracker.record("email_clusters", self.session_id, clusters=len(clusters), leads=len(records))
+        records = [record for record in records if record.email is not None]
+        self.state["budget"] = self.governor.report()
+        tracker.record("write_email", self.session_id, count=len(records))
+        self.state["model_routing"] = self.routing.summary()
+        tracker.record("model_routing", self.session_id, **self.state["model_routing"])
+        tracker.record("budget", self.session_id, **self.state["budget"])
+        return records
 
     @listen(write_email)
-    def send_email(self, emails):
-        # Here we would send the emails to the leads
-        return emails
+    def send_email(self, records):
+        delivery_config = pipeline_config.get('delivery', {})
+        if delivery_config.get('enabled'):
+            leads = self.state["leads"]
+            messages = [
+                {"recipient": leads[record.index]["lead_data"]["email"], "body": record.email}
+                for record in records
+            ]
+            delivery = EmailDelivery(delivery_config)
+            try:
+                self.state["delivery_status"] = delivery.deliver_all(messages)
+            finally:
+                delivery.close()
+            statuses = [status["status"] for status in self.state["delivery_status"]]
+            tracker.record("send_email", self.session_id, **{status: statuses.count(status) for status in set(statuses)})
+        tracker.end_session(self.session_id)
+        return records
 # End of program
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+USAGE_FIELDS = ('total_tokens', 'prompt_tokens', 'cached_prompt_tokens', 'completion_tokens', 'successful_requests')
+
+
+class TranscriptStore:
+    """Append-only JSON lines file holding the full crew transcripts of a run.
+    Records keep only the (offset, length) of their transcript and read it back
+    on demand, so raw text never accumulates in memory.
+
+    One file is written per run; only the `keep_runs` most recent files are
+    kept (None keeps everything)."""
+
+    def __init__(self, directory: str, run_id: Optional[str] = None, keep_runs: Optional[int] = 20):
+        os.makedirs(directory, exist_ok=True)
+        if keep_runs is not None:
+            self.prune(directory, keep_runs - 1)
+        self.path = os.path.join(directory, f"{run_id or uuid.uuid4().hex}.jsonl")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prune(directory: str, keep: int):
+        """Delete all but the `keep` most recently written transcript files."""
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[max(keep, 0):]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Pruned concurrently by another run
+
+    def append(self, transcript: Dict) -> Tuple[int, int]:
+        data = (json.dumps(transcript, default=str) + "\n").encode()
+        with self._lock, open(self.path, "ab") as file:
+            offset = file.tell()
+            file.write(data)
+        return offset, len(data)
+
+    def append_ref(self, transcript: Dict) -> Tuple[str, int, int]:
+        """Append `transcript` and return a self-contained (path, offset, length) reference."""
+        return (self.path, *self.append(transcript))
+
+
+def load_transcript(ref: Tuple[str, int, int]) -> Optional[Dict]:
+    """The transcript at `ref`, or None once its run file has been pruned. Needs
+    no TranscriptStore, so records stay plain data (crewai deep-copies flow state)."""
+    path, offset, length = ref
+    try:
+        with open(path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+    except FileNotFoundError:
+        return None
+
+
+def crew_transcript(crew_output) -> Dict:
+    return {
+        "raw": crew_output.raw,
+        "tasks_output": [
+            {"agent": task.agent, "description": task.description, "raw": task.raw}
+            for task in crew_output.tasks_output
+        ],
+        "token_usage": crew_output.token_usage.model_dump(),
+    }
+
+
+def usage_tuple(crew_output) -> Tuple[int, ...]:
+    usage = crew_output.token_usage
+    return tuple(int(getattr(usage, field, 0) or 0) for field in USAGE_FIELDS)
+
+
+class LeadRecord:
+    """Compact per-lead result: the fields the dashboard, filtering, email and
+    delivery stages read, plus references to the transcripts spilled to disk.
+
+    Records live in flow state, which crewai deep-copies on every method event,
+    so they hold only plain values: the store is used while attaching output
+    but never kept."""
+
+    __slots__ = (
+        'index', 'name', 'job_title', 'role_relevance', 'professional_background',
+        'company_name', 'industry', 'company_size', 'revenue', 'market_presence',
+        'score', 'scoring_criteria', 'validation_notes', 'early_exit',
+        'score_usage', 'email', 'email_usage', 'score_transcript', 'email_transcript', 'shared',
+    )
+
+    def __init__(self, index, result, score_usage, score_transcript=None, early_exit=None):
+        personal_info = result.personal_info
+        company_info = result.company_info
+        self.index = index
+        self.name = personal_info.name
+        self.job_title = personal_info.job_title
+        self.role_relevance = personal_info.role_relevance
+        self.professional_background = personal_info.professional_background
+        self.company_name = company_info.company_name
+        self.industry = company_info.industry
+        self.company_size = company_info.company_size
+        self.revenue = company_info.revenue
+        self.market_presence = company_info.market_presence
+        self.score = result.lead_score.score
+        self.scoring_criteria = tuple(result.lead_score.scoring_criteria)
+        self.validation_notes = result.lead_score.validation_notes
+        self.early_exit = early_exit
+        self.score_usage = score_usage
+        self.score_transcript = score_transcript
+        self.email = None
+        self.email_usage = None
+        self.email_transcript = None
+        # Stages whose result came from another session's in-flight run
+        self.shared = ()
+
+    @classmethod
+    def from_crew_output(cls, index, crew_output, result, store=None, early_exit=None):
+        """Compact a lead scoring CrewOutput; `result` is its LeadScoringResult."""
+        ref = store.append_ref(crew_transcript(crew_output)) if store is not None else None
+        return cls(index, result, usage_tuple(crew_output), ref, early_exit)
+
+    def attach_email(self, crew_output, store=None):
+        self.email = crew_output.raw
+        self.email_usage = usage_tuple(crew_output)
+        if store is not None:
+            self.email_transcript = store.append_ref(crew_transcript(crew_output))
+
+    def attach_personalized_email(self, email: str, usage: Tuple[int, ...], base_draft: str, store=None):
+        """Email produced by personalizing a cluster's base draft rather than a full crew run."""
+        self.email = email
+        self.email_usage = usage
+        if store is not None:
+            self.email_transcript = store.append_ref({"raw": email, "base_draft": base_draft, "token_usage": dict(zip(USAGE_FIELDS, usage))})
+
+    def email_inputs(self) -> Dict:
+        """Inputs for email_writing_crew, matching LeadScoringResult.to_dict()."""
+        return {
+            "personal_info": {
+                "name": self.name,
+                "job_title": self.job_title,
+                "role_relevance": self.role_relevance,
+                "professional_background": self.professional_background,
+            },
+            "company_info": {
+                "company_name": self.company_name,
+                "industry": self.industry,
+                "company_size": self.company_size,
+                "revenue": self.revenue,
+                "market_presence": self.market_presence,
+            },
+            "lead_score": {
+                "score": self.score,
+                "scoring_criteria": list(self.scoring_criteria),
+                "validation_notes": self.validation_notes,
+            },
+        }
+
+    def score_table(self) -> Dict:
+        return {
+            'Name': self.name,
+            'Job Title': self.job_title,
+            'Role Relevance': self.role_relevance,
+            'Professional Background': self.professional_background,
+            'Company Name': self.company_name,
+            'Industry': self.industry,
+            'Company Size': self.company_size,
+            'Revenue': self.revenue,
+            'Market Presence': self.market_presence,
+            'Lead Score': self.score,
+            'Scoring Criteria': ', '.join(self.scoring_criteria),
+            'Validation Notes': self.validation_notes,
+        }
+
+    def filtered_table(self) -> Dict:
+        return {
+            'Name': self.name,
+            'Job Title': self.job_title,
+            'Role Relevance': self.role_relevance,
+            'Professional Background': self.professional_background,
+            'Company Name': self.company_name,
+            'Industry': self.industry,
+            'Validation Notes': self.validation_notes,
+        }
+
+    def score_usage_dict(self) -> Dict:
+        return dict(zip(USAGE_FIELDS, self.score_usage or ()))
+
+    def email_usage_dict(self) -> Dict:
+        return dict(zip(USAGE_FIELDS, self.email_usage or ()))
+
+    def load_score_transcript(self) -> Optional[Dict]:
+        return load_transcript(self.score_transcript) if self.score_transcript else None
+
+    def load_email_transcript(self) -> Optional[Dict]:
+        return load_transcript(self.email_transcript) if self.email_transcript else None
@@ -0,0 +1,248 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONFIDENCE_PATTERN = re.compile(r'^\s*confidence\s*:\s*(\d+(?:\.\d+)?)\s*(?:/\s*10)?\s*$', re.IGNORECASE | re.MULTILINE)
+
+# Keys in agents.yaml that belong to the router and must not reach crewai's Agent
+ROUTER_KEYS = ('llm', 'cascade', 'stream')
+
+# Routing log of the pipeline run whose crew is executing in this context
+_current_log = contextvars.ContextVar('routing_log', default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def parse_confidence(text: str) -> Tuple[Optional[float], str]:
+    """Pull a trailing 'Confidence: N/10' line out of a free-text answer.
+    Returns the confidence (or None) and the text without that line."""
+    match = CONFIDENCE_PATTERN.search(text)
+    if not match:
+        return None, text
+    cleaned = (text[:match.start()] + text[match.end():]).strip()
+    return float(match.group(1)), cleaned
+
+
+def validate_structured(output) -> Tuple[bool, Optional[float], str]:
+    """Validator for tasks with output_pydantic that carry a `confidence` field."""
+    if output.pydantic is None:
+        return False, None, "structured output failed validation"
+    return True, getattr(output.pydantic, 'confidence', None), output.raw
+
+
+def validate_text(output) -> Tuple[bool, Optional[float], str]:
+    """Validator for free-text tasks that end with a 'Confidence: N/10' line."""
+    confidence, cleaned = parse_confidence(output.raw or "")
+    if not cleaned:
+        return False, confidence, "empty answer"
+    return True, confidence, cleaned
+
+
+class RoutingLog:
+    """Routing decisions of one pipeline run.
+
+    Guardrails add a decision per cascaded task; once the crew finishes,
+    `settle` fills in the tokens the cheap model actually used from each
+    agent's usage, so every decision carries a net cost against running the
+    same work on the strong model.
+
+    `budget` is the run's BudgetGovernor, if any: escalations are charged to
+    it, and none are made once its cheap_model or stop step is active."""
+
+    def __init__(self, prices: Dict, budget=None):
+        self.prices = prices
+        self.budget = budget
+        self.decisions: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def may_escalate(self) -> bool:
+        return self.budget is None or not (self.budget.active('cheap_model') or self.budget.active('stop'))
+
+    def charge(self, model: str, prompt_tokens: int, completion_tokens: int):
+        if self.budget is not None:
+            self.budget.charge(prompt_tokens + completion_tokens, model)
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        return self.prices.get(model, 0.0) * (prompt_tokens + completion_tokens) / 1_000_000
+
+    def add(self, decision: Dict):
+        with self._lock:
+            self.decisions.append(decision)
+
+    def settle(self, crew, agents_config: Dict):
+        """Attribute each agent's real usage from the crew that just ran to its unsettled decisions."""
+        with self._lock:
+            pending = [d for d in self.decisions if d["prompt_tokens"] is None]
+        for crew_agent in crew.agents:
+            token_process = getattr(crew_agent, '_token_process', None)
+            if token_process is None:
+                continue
+            usage = token_process.get_summary()
+            name = next((n for n, c in agents_config.items() if c.get('role', '').strip() == crew_agent.role.strip()), None)
+            decisions = [d for d in pending if d["agent"] == name]
+            for decision in decisions:
+                decision["prompt_tokens"] = usage.prompt_tokens // len(decisions)
+                decision["completion_tokens"] = usage.completion_tokens // len(decisions)
+                self._settle_cost(decision)
+
+    def _settle_cost(self, decision: Dict):
+        prompt, completion = decision["prompt_tokens"], decision["completion_tokens"]
+        cost = self.cost(decision["cheap_model"], prompt, completion)
+        if decision["escalated"]:
+            cost += decision["escalation_cost"]
+        decision["cost"] = cost
+        # Against doing the same work on the strong model; negative when an escalation cost more
+        decision["cost_saved"] = self.cost(decision["strong_model"], prompt, completion) - cost
+
+    def summary(self) -> Dict:
+        with self._lock:
+            decisions = list(self.decisions)
+        settled = [d for d in decisions if d["prompt_tokens"] is not None]
+        escalations = [d for d in decisions if d["escalated"]]
+        return {
+            "decisions": len(decisions),
+            "escalations": len(escalations),
+            "escalations_blocked": sum(1 for d in decisions if d["blocked"]),
+            "cost": sum(d["cost"] for d in settled),
+            "cost_saved": sum(d["cost_saved"] for d in settled),
+            "escalation_latency": sum(d["escalation_latency"] for d in escalations),
+        }
+
+
+class ModelRouter:
+    """Chooses the model for each agent from agents.yaml and, for agents with a
+    `cascade` block, escalates a task to a stronger model when its output fails
+    validation or reports a confidence below the threshold.
+
+    Escalation is implemented as a crewai task guardrail: the cheap model does
+    the full task (including tool calls) and the strong model only rewrites the
+    answer from the task description and the cheap draft."""
+
+    def __init__(self, agents_config: Dict, config: Optional[Dict] = None):
+        config = config or {}
+        self.agents_config = agents_config
+        self.default_model = config.get('default', os.getenv('OPENAI_MODEL_NAME', 'gpt-4o-mini'))
+        self.base_url = os.getenv('MODEL_ROUTER_BASE_URL', config.get('base_url'))
+        self.prices = config.get('prices', {})
+
+    def model_for(self, agent_name: str) -> str:
+        return self.agents_config[agent_name].get('llm', self.default_model)
+
+    def agent_config(self, agent_name: str) -> Dict:
+        return {key: value for key, value in self.agents_config[agent_name].items() if key not in ROUTER_KEYS}
+
+    def llm(self, model: str, stream: bool = False):
+        from crewai import LLM
+        if self.base_url:
+            return LLM(model=model, stream=stream, base_url=self.base_url, api_key=os.getenv('OPENAI_API_KEY', 'stub'))
+        return LLM(model=model, stream=stream)
+
+    def agent_llm(self, agent_name: str):
+        return self.llm(self.model_for(agent_name), stream=self.agents_config[agent_name].get('stream', False))
+
+    def new_log(self, budget=None) -> RoutingLog:
+        return RoutingLog(self.prices, budget)
+
+    @contextmanager
+    def tracking(self, log: RoutingLog):
+        """Record the decisions of crews kicked off inside this block into `log`."""
+        token = _current_log.set(log)
+        try:
+            yield log
+        finally:
+            _current_log.reset(token)
+
+    def cascade(self, agent_name: str, validate: Callable, output_model=None) -> Optional[Callable]:
+        """Build the guardrail for `agent_name`, or None if it has no cascade block.
+        `output_model` is the task's output_pydantic, whose schema the strong model is given.
+
+        The guardrail never rejects an answer: when escalation is blocked or
+        fails, the cheap answer is kept (even if it failed validation) and the
+        caller deals with a missing structured result, rather than crewai
+        retrying the task and finally failing the whole crew."""
+        cascade_config = self.agents_config[agent_name].get('cascade')
+        if not cascade_config:
+            return None
+        cheap_model = self.model_for(agent_name)
+        strong_model = cascade_config['escalate_to']
+        min_confidence = cascade_config.get('min_confidence', 7)
+
+        def guardrail(output):
+            log = _current_log.get()
+            decision = {
+                "agent": agent_name,
+                "cheap_model": cheap_model,
+                "strong_model": strong_model,
+                "escalated": False,
+                # Escalation was needed but the run's budget no longer allows it
+                "blocked": False,
+                "reason": None,
+                "escalation_latency": 0.0,
+                "escalation_cost": 0.0,
+                # Filled in by RoutingLog.settle once the crew has finished
+                "prompt_tokens": None,
+                "completion_tokens": None,
+            }
+            valid, confidence, result = validate(output)
+            if valid and (confidence is None or confidence >= min_confidence):
+                if log is not None:
+                    log.add(decision)
+                return True, result
+            decision["reason"] = result if not valid else f"confidence {confidence} below {min_confidence}"
+            if log is not None and not log.may_escalate():
+                decision["blocked"] = True
+                log.add(decision)
+                return True, result if valid else output.raw
+            try:
+                started = time.perf_counter()
+                escalated, usage = self._escalate(strong_model, output, output_model)
+                decision["escalation_latency"] = time.perf_counter() - started
+            except Exception:
+                # Keep the cheap answer rather than failing the crew
+                logger.warning("Escalation of %s to %s failed", agent_name, strong_model, exc_info=True)
+                if log is not None:
+                    log.add(decision)
+                return True, result if valid else output.raw
+            decision["escalated"] = True
+            if log is not None:
+                decision["escalation_cost"] = log.cost(strong_model, usage.prompt_tokens, usage.completion_tokens)
+                log.charge(strong_model, usage.prompt_tokens, usage.completion_tokens)
+                log.add(decision)
+            return True, parse_confidence(escalated)[1]
+
+        return guardrail
+
+    def _escalate(self, model: str, output, output_model=None):
+        prompt = f"Task:\n{output.description}\n\n"
+        expected_output = getattr(output, 'expected_output', None)
+        if expected_output:
+            prompt += f"Expected output:\n{expected_output}\n\n"
+        prompt += f"Junior analyst's answer:\n{output.raw}\n\n"
+        if output_model is not None:
+            schema = json.dumps(output_model.model_json_schema())
+            prompt += (
+                "Rewrite the answer so it fully and accurately completes the task. "
+                f"Reply with only a JSON object that validates against this JSON schema:\n{schema}"
+            )
+        else:
+            prompt += "Rewrite the answer so it fully and accurately completes the task, keeping the same output format."
+        messages = [
+            {"role": "system", "content": "You review and correct answers produced by a junior analyst."},
+            {"role": "user", "content": prompt},
+        ]
+        # litellm directly rather than LLM.call, which does not return the usage
+        import litellm
+        kwargs = {"base_url": self.base_url, "api_key": os.getenv('OPENAI_API_KEY', 'stub')} if self.base_url else {}
+        response = litellm.completion(model=model, messages=messages, **kwargs)
+        return response.choices[0].message.content, response.usage
@@ -0,0 +1,93 @@
+"""Minimal OpenAI-compatible chat completions server for exercising the model
+router offline. Point the pipeline at it with
+
+    MODEL_ROUTER_BASE_URL=http://127.0.0.1:8001/v1 python -m streamlit run app4.py
+
+Canned answers are looked up by model name in a JSON file ({"gpt-4o-mini": "..."})
+and every request is logged so routing decisions can be checked. Requests with
+"stream": true (the email agents) get the answer as server-sent event chunks."""
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "Thought: I now know the final answer\nFinal Answer: stub answer\nConfidence: 5/10"
+
+
+def make_handler(responses, log):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "")
+            answer = responses.get(model, responses.get("default", DEFAULT_ANSWER))
+            messages = body.get("messages", [])
+            log.append({"model": model, "messages": len(messages), "prompt": str(messages[-1].get("content", "")) if messages else ""})
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+            completion_tokens = len(answer) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            if body.get("stream"):
+                self.stream(model, answer, usage, body.get("stream_options") or {})
+                return
+            payload = json.dumps({
+                "id": f"stub-{len(log)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def stream(self, model, answer, usage, stream_options):
+            """Server-sent events in the OpenAI chunk format: the answer a few words
+            at a time, a final chunk with finish_reason, usage if asked for, then [DONE]."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            base = {"id": f"stub-{len(log)}", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            pieces = re.findall(r"\s*\S+(?:\s+\S+){0,2}", answer) or [answer]
+            chunks = [{"index": 0, "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece}, "finish_reason": None}
+                      for i, piece in enumerate(pieces)]
+            chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+            events = [{**base, "choices": [choice]} for choice in chunks]
+            if stream_options.get("include_usage"):
+                events.append({**base, "choices": [], "usage": usage})
+            for event in events:
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            entry = log[-1] if log else {}
+            print(f"stub: {entry.get('model')} ({entry.get('messages')} messages)")
+
+    return StubHandler
+
+
+def serve(port=8001, responses=None):
+    log = []
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(responses or {}, log))
+    server.requests_log = log
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--responses", help="JSON file mapping model name to canned answer")
+    args = parser.parse_args()
+    responses = {}
+    if args.responses:
+        with open(args.responses) as file:
+            responses = json.load(file)
+    serve(args.port, responses).serve_forever()
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def config_version(paths: Iterable[str]) -> str:
+    """Hash of the config files, so work is only shared between runs of the same configuration."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Process-wide de-duplication of in-flight work.
+
+    The first caller for a key runs the function; callers that arrive with the
+    same key while it is running block until it finishes and receive the same
+    result (or exception). Nothing is cached once the call completes. Streamlit
+    sessions share one Python process, so a module-level instance covers every
+    open dashboard."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` once per in-flight `key`. Returns (result, shared), where
+        shared is True when this caller reused another caller's work."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                owner = False
+            else:
+                call = self._calls[key] = _Call()
+                owner = True
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> Dict[str, int]:
+        """Keys currently running and how many callers are waiting on each."""
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
+
+
+coordinator = SingleFlight()
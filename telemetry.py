@@ -0,0 +1,186 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NoopExporter:
+    """Drops every batch. Used for benchmarks and when telemetry is disabled."""
+
+    def export(self, batch: List[Dict]):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileExporter:
+    """Appends each record as one JSON line to a local file (works air-gapped)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, batch: List[Dict]):
+        with open(self.path, "a") as file:
+            for record in batch:
+                file.write(json.dumps(record, default=str) + "\n")
+
+    def close(self):
+        pass
+
+
+class AgentOpsExporter:
+    """Forwards batches to AgentOps. The SDK is imported and initialised lazily
+    on the flush thread, so importing the pipeline never touches the network."""
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self._agentops = None
+        # Our session ids -> AgentOps sessions, so concurrent runs stay separate
+        self._sessions = {}
+
+    def _client(self):
+        if self._agentops is None:
+            import agentops
+            agentops.init(self.api_key, skip_auto_end_session=True, auto_start_session=False)
+            self._agentops = agentops
+        return self._agentops
+
+    def export(self, batch: List[Dict]):
+        agentops = self._client()
+        for record in batch:
+            session_id = record.get("session_id")
+            if record["type"] == "session_start":
+                self._sessions[session_id] = agentops.start_session(tags=record.get("tags"))
+            elif record["type"] == "session_end":
+                session = self._sessions.pop(session_id, None)
+                if session is not None:
+                    session.end_session(record.get("end_state", "Success"))
+            else:
+                event = agentops.ActionEvent(action_type=record["type"], params=record)
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    session.record(event)
+                else:
+                    agentops.record(event)
+
+    def close(self):
+        pass
+
+
+class Telemetry:
+    """Buffers session and event records in memory and flushes them in batches
+    from a background thread. `record` never blocks: when the buffer is full
+    the record is dropped and counted in `dropped`.
+
+    One Telemetry instance is shared by every run in the process, so each run
+    keeps the id returned by `start_session` and passes it to `record` and
+    `end_session`."""
+
+    def __init__(self, exporter, batch_size: int = 100, flush_interval: float = 5.0, max_buffer: int = 10_000):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+        if not isinstance(exporter, NoopExporter):
+            self._worker = threading.Thread(target=self._run, name="telemetry-flush", daemon=True)
+            self._worker.start()
+            atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return self._worker is not None
+
+    def record(self, event_type: str, session_id: Optional[str] = None, **fields):
+        if not self.enabled:
+            return
+        record = {"type": event_type, "ts": time.time(), "session_id": session_id, **fields}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start_session(self, tags: Optional[List[str]] = None) -> str:
+        session_id = str(uuid.uuid4())
+        self.record("session_start", session_id, tags=tags or [])
+        return session_id
+
+    def end_session(self, session_id: str, end_state: str = "Success"):
+        self.record("session_end", session_id, end_state=end_state)
+
+    def flush(self):
+        """Ask the worker to export whatever is buffered right away."""
+        self._flush_requested.set()
+
+    def close(self, timeout: float = 5.0):
+        if not self.enabled or self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._flush_requested.set()
+        self._worker.join(timeout)
+        self.exporter.close()
+
+    def _drain(self) -> List[Dict]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Dict]):
+        try:
+            self.exporter.export(batch)
+        except Exception:
+            # Telemetry failures must never surface in a crew step.
+            logger.warning("Telemetry export of %d records failed", len(batch), exc_info=True)
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._export(batch)
+            if self._stopped.is_set() and self._queue.empty():
+                return
+
+
+def build_exporter(config: Dict):
+    """Create an exporter from the `telemetry` section of config/pipeline.yaml.
+    The TELEMETRY_MODE environment variable overrides the configured mode."""
+    mode = os.getenv("TELEMETRY_MODE", config.get("mode", "file"))
+    if mode == "noop":
+        return NoopExporter()
+    if mode == "file":
+        return FileExporter(config.get("path", "telemetry.jsonl"))
+    if mode == "agentops":
+        return AgentOpsExporter(os.getenv("AGENTOPS_API_KEY"))
+    raise ValueError(f"Unknown telemetry mode '{mode}'. Expected one of: noop, file, agentops.")
+
+
+def init(config: Optional[Dict] = None) -> Telemetry:
+    config = config or {}
+    return Telemetry(
+        build_exporter(config),
+        batch_size=config.get("batch_size", 100),
+        flush_interval=config.get("flush_interval", 5.0),
+        max_buffer=config.get("max_buffer", 10_000),
+    )
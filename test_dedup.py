@@ -0,0 +1,56 @@
+from dedup import LeadDeduplicator
+
+
+def lead(name, company, email, use_case="Using AI Agent for automation."):
+    return {"lead_data": {"name": name, "job_title": "CEO", "company": company, "email": email, "use_case": use_case}}
+
+
+def deduplicator():
+    return LeadDeduplicator({"threshold": 0.9, "free_email_domains": ["gmail.com"]})
+
+
+def test_different_people_at_the_same_company_are_kept():
+    leads = [
+        lead("Mark Johnson", "Acme", "mark@acme.com"),
+        lead("Mary Johnson", "Acme", "mary@acme.com"),
+    ]
+    assert deduplicator().find_groups(leads) == []
+
+
+def test_near_matches_do_not_chain_into_one_group():
+    leads = [
+        lead("John Smith", "Acme", "john@acme.com"),
+        lead("Jon Smith", "Acme", "jon@acme.com"),
+        lead("Jane Smith", "Acme", "jane@acme.com"),
+    ]
+    assert deduplicator().find_groups(leads) == []
+
+
+def test_chain_without_emails_is_checked_against_the_group_root():
+    # John~Jon and Jon~Jan clear the threshold, John~Jan does not
+    leads = [
+        lead("John Smith", "Acme", None),
+        lead("Jon Smith", "Acme", None),
+        lead("Jan Smith", "Acme", None),
+    ]
+    assert LeadDeduplicator({"threshold": 0.95}).find_groups(leads) == [[0, 1]]
+
+
+def test_same_lead_resubmitted_is_merged():
+    leads = [
+        lead("Abdulaziz AlMulhem ", "packman.ai", "Abdulaziz@packman.ai"),
+        lead("Pavel Sher", "FuseBase", "paul@fusebase.com"),
+        lead("abdulaziz almulhem", "Packman.ai", "abdulaziz@packman.ai"),
+        lead("Abdulaziz Almulhem", "packman", "abdulaziz.almulhem@gmail.com"),
+    ]
+    merged, groups = deduplicator().deduplicate(leads)
+    assert groups == [[0, 2, 3]]
+    assert [item["lead_data"]["email"] for item in merged] == ["abdulaziz@packman.ai", "paul@fusebase.com"]
+
+
+def test_dotted_and_tagged_mailboxes_are_the_same_person():
+    leads = [
+        lead("John Smith", "Acme", "john.smith@acme.com"),
+        lead("John Smith", "Acme Inc", "johnsmith+forms@acme.com"),
+    ]
+    assert deduplicator().find_groups(leads) == [[0, 1]]
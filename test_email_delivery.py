@@ -0,0 +1,109 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from email_delivery import EmailDelivery
+
+
+class FlakyServer:
+    """Accepts everything except reject@ (550) and flaky@ (451 on the first try)."""
+
+    def __init__(self):
+        self.received = []
+        self.sessions = 0
+        self.deferred = set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('reject@'):
+            return '550 5.1.1 No such user'
+        if address.startswith('flaky@') and address not in self.deferred:
+            self.deferred.add(address)
+            return '451 4.3.0 Try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append(envelope.rcpt_tos[0])
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    handler = FlakyServer()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def delivery_for(port, ledger_path):
+    return EmailDelivery({
+        'host': '127.0.0.1', 'port': port, 'sender': 'sales@example.com', 'subject': 'Hello',
+        'campaign': 'test', 'ledger_path': str(ledger_path), 'pool_size': 1, 'workers': 1,
+        'max_retries': 2, 'backoff': 0,
+    })
+
+
+MESSAGES = [
+    {"recipient": "reject@example.com", "body": "one"},
+    {"recipient": "flaky@example.com", "body": "two"},
+    {"recipient": "ok@example.com", "body": "three"},
+]
+
+
+def test_permanent_reject_is_not_retried_and_keeps_the_connection(server, tmp_path):
+    handler, port = server
+    delivery = delivery_for(port, tmp_path / 'ledger.db')
+    try:
+        rejected, _, sent = delivery.deliver_all(MESSAGES)
+    finally:
+        delivery.close()
+    assert rejected['status'] == 'rejected'
+    assert rejected['attempts'] == 1
+    assert sent['status'] == 'sent'
+    assert handler.sessions == 1
+
+
+def test_temporary_failure_is_retried(server, tmp_path):
+    handler, port = server
+    delivery = delivery_for(port, tmp_path / 'ledger.db')
+    try:
+        status = delivery.deliver(MESSAGES[1]['recipient'], MESSAGES[1]['body'])
+    finally:
+        delivery.close()
+    assert status['status'] == 'sent'
+    assert status['attempts'] == 2
+    assert handler.received == ['flaky@example.com']
+
+
+def test_resumed_run_sends_nothing_twice(server, tmp_path):
+    handler, port = server
+    delivery = delivery_for(port, tmp_path / 'ledger.db')
+    try:
+        delivery.deliver_all(MESSAGES)
+    finally:
+        delivery.close()
+    assert sorted(handler.received) == ['flaky@example.com', 'ok@example.com']
+
+    # A regenerated body must not defeat the idempotency key
+    rewritten = [{**message, "body": message["body"] + " (regenerated)"} for message in MESSAGES]
+    resumed = delivery_for(port, tmp_path / 'ledger.db')
+    try:
+        statuses = resumed.deliver_all(rewritten)
+    finally:
+        resumed.close()
+    assert [status['status'] for status in statuses] == ['skipped_duplicate'] * 3
+    assert [status['ledger_status'] for status in statuses] == ['rejected', 'sent', 'sent']
+    assert sorted(handler.received) == ['flaky@example.com', 'ok@example.com']
@@ -0,0 +1,47 @@
+import copy
+from types import SimpleNamespace
+
+from lead_records import LeadRecord, TranscriptStore
+
+
+def crew_output(raw):
+    usage = SimpleNamespace(
+        total_tokens=30, prompt_tokens=20, cached_prompt_tokens=0, completion_tokens=10, successful_requests=1,
+        model_dump=lambda: {"total_tokens": 30},
+    )
+    return SimpleNamespace(raw=raw, tasks_output=[], token_usage=usage)
+
+
+def scoring_result():
+    return SimpleNamespace(
+        personal_info=SimpleNamespace(name="Ada Lovelace", job_title="CTO", role_relevance=9, professional_background="Engineer"),
+        company_info=SimpleNamespace(company_name="Acme", industry="Software", company_size=50, revenue=1_000_000, market_presence=7),
+        lead_score=SimpleNamespace(score=80, scoring_criteria=["Budget, authority", "Fit"], validation_notes="ok"),
+    )
+
+
+def test_flow_state_with_records_can_be_deep_copied(tmp_path):
+    # crewai's Flow deep-copies its state on every method started/finished event
+    store = TranscriptStore(str(tmp_path))
+    record = LeadRecord.from_crew_output(0, crew_output("score"), scoring_result(), store)
+    record.attach_email(crew_output("Hello Ada"), store)
+    state = {"score_crews_results": [record], "filtered_leads": [record], "emails": [record]}
+
+    copied = copy.deepcopy(state)
+
+    copied_record = copied["emails"][0]
+    assert copied_record.email == "Hello Ada"
+    assert copied_record.load_score_transcript()["raw"] == "score"
+    assert copied_record.load_email_transcript()["raw"] == "Hello Ada"
+
+
+def test_scoring_criteria_round_trip():
+    record = LeadRecord(0, scoring_result(), ())
+    assert record.email_inputs()["lead_score"]["scoring_criteria"] == ["Budget, authority", "Fit"]
+
+
+def test_pruned_transcript_loads_as_none(tmp_path):
+    store = TranscriptStore(str(tmp_path), keep_runs=1)
+    record = LeadRecord.from_crew_output(0, crew_output("score"), scoring_result(), store)
+    TranscriptStore(str(tmp_path), keep_runs=1)
+    assert record.load_score_transcript() is None
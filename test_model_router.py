@@ -0,0 +1,116 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import openai_stub
+from budget import BudgetGovernor
+from model_router import ModelRouter, validate_structured, validate_text
+
+AGENTS = {
+    "writer": {"role": "Writer", "llm": "openai/cheap", "cascade": {"escalate_to": "openai/strong", "min_confidence": 7}},
+    "plain": {"role": "Plain", "llm": "openai/cheap"},
+}
+PRICES = {"openai/cheap": 1.0, "openai/strong": 10.0, "nano": 0.5}
+
+
+class Report:
+    @staticmethod
+    def model_json_schema():
+        return {"title": "Report", "type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+
+
+@pytest.fixture
+def stub():
+    server = openai_stub.serve(0, {"strong": "Better answer\nConfidence: 9/10"})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_router(stub=None):
+    config = {"prices": PRICES}
+    if stub is not None:
+        config["base_url"] = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+    return ModelRouter(AGENTS, config)
+
+
+def task_output(raw, pydantic=None):
+    return SimpleNamespace(raw=raw, pydantic=pydantic, description="Write the email.", expected_output="A short email.")
+
+
+def test_confident_answer_is_kept():
+    router = make_router()
+    log = router.new_log()
+    with router.tracking(log):
+        assert router.cascade("writer", validate_text)(task_output("Hello\nConfidence: 8/10")) == (True, "Hello")
+    assert log.summary()["escalations"] == 0
+    assert router.cascade("plain", validate_text) is None
+
+
+def test_low_confidence_escalates(stub):
+    pytest.importorskip("litellm")
+    router = make_router(stub)
+    log = router.new_log()
+    with router.tracking(log):
+        result = router.cascade("writer", validate_text)(task_output("Meh\nConfidence: 3/10"))
+    assert result == (True, "Better answer")
+    [decision] = log.decisions
+    assert decision["escalated"] and decision["reason"] == "confidence 3.0 below 7"
+    assert decision["escalation_cost"] > 0
+    assert [entry["model"] for entry in stub.requests_log] == ["strong"]
+    assert "Expected output:\nA short email." in stub.requests_log[0]["prompt"]
+
+
+def test_validation_failure_escalates_with_schema(stub):
+    pytest.importorskip("litellm")
+    router = make_router(stub)
+    log = router.new_log()
+    with router.tracking(log):
+        valid, _ = router.cascade("writer", validate_structured, Report)(task_output("not json"))
+    assert valid
+    assert log.decisions[0]["escalated"]
+    assert log.decisions[0]["reason"] == "structured output failed validation"
+    assert json.dumps(Report.model_json_schema()) in stub.requests_log[0]["prompt"]
+
+
+def test_blocked_escalation_keeps_the_cheap_answer(stub):
+    router = make_router(stub)
+    budget = BudgetGovernor({"max_tokens": 100, "cheap_model": "nano", "degrade": [{"at": 0.5, "action": "cheap_model"}]}, PRICES)
+    budget.charge(60, "openai/cheap")
+    log = router.new_log(budget)
+    with router.tracking(log):
+        result = router.cascade("writer", validate_structured, Report)(task_output("not json"))
+    # Never rejected: crewai would retry and then fail the whole crew
+    assert result == (True, "not json")
+    assert log.summary()["escalations_blocked"] == 1
+    assert stub.requests_log == []
+    assert budget.tokens == 60
+
+
+def test_settle_and_summary_costs():
+    router = make_router()
+    log = router.new_log()
+    log.add({"agent": "writer", "cheap_model": "openai/cheap", "strong_model": "openai/strong", "escalated": False,
+             "blocked": False, "escalation_latency": 0.0, "escalation_cost": 0.0, "prompt_tokens": None, "completion_tokens": None})
+    log.add({"agent": "writer", "cheap_model": "openai/cheap", "strong_model": "openai/strong", "escalated": True,
+             "blocked": False, "escalation_latency": 0.5, "escalation_cost": 0.02, "prompt_tokens": None, "completion_tokens": None})
+    usage = SimpleNamespace(prompt_tokens=1_600_000, completion_tokens=400_000)
+    crew_agent = SimpleNamespace(role="Writer", _token_process=SimpleNamespace(get_summary=lambda: usage))
+    log.settle(SimpleNamespace(agents=[crew_agent]), AGENTS)
+
+    # Each decision gets half of the agent's 2M tokens: 1M tokens at $1 vs $10 per 1M
+    first, second = log.decisions
+    assert (first["prompt_tokens"], first["completion_tokens"]) == (800_000, 200_000)
+    assert first["cost"] == pytest.approx(1.0)
+    assert first["cost_saved"] == pytest.approx(9.0)
+    assert second["cost"] == pytest.approx(1.02)
+    assert second["cost_saved"] == pytest.approx(8.98)
+    summary = log.summary()
+    assert summary["decisions"] == 2 and summary["escalations"] == 1
+    assert summary["cost"] == pytest.approx(2.02)
+    assert summary["cost_saved"] == pytest.approx(17.98)
+    assert summary["escalation_latency"] == pytest.approx(0.5)
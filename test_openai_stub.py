@@ -0,0 +1,43 @@
+import json
+import threading
+import urllib.request
+
+import pytest
+
+import openai_stub
+
+
+@pytest.fixture
+def stub():
+    server = openai_stub.serve(0, {"default": "Hello there, this is a streamed stub answer"})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request)
+
+
+def test_plain_completion(stub):
+    with post(stub, {"model": "cheap", "messages": [{"role": "user", "content": "hi"}]}) as response:
+        body = json.load(response)
+    assert body["choices"][0]["message"]["content"] == "Hello there, this is a streamed stub answer"
+    assert body["usage"]["total_tokens"] > 0
+
+
+def test_streamed_completion(stub):
+    body = {"model": "cheap", "messages": [{"role": "user", "content": "hi"}], "stream": True,
+            "stream_options": {"include_usage": True}}
+    with post(stub, body) as response:
+        assert response.headers["Content-Type"] == "text/event-stream"
+        events = [line[len(b"data: "):].decode() for line in response.read().splitlines() if line.startswith(b"data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(choice["delta"].get("content", "") for chunk in chunks for choice in chunk["choices"])
+    assert content == "Hello there, this is a streamed stub answer"
+    assert len([chunk for chunk in chunks if chunk["choices"] and chunk["choices"][0]["delta"].get("content")]) > 1
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["usage"]["total_tokens"] > 0